@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import portfolio_core as core
+from data_providers import LocalFileProvider
+from price_cache import DEFAULT_CACHE_DIR, PriceCache
+from profiling import Profiler
+
+# Headless batch runner: evaluates many portfolio specs across a process pool without the web UI.
+#
+#   python batch.py specs.json --output results.csv --workers 8
+#
+# The spec file is a JSON list (or JSON Lines) of objects like
+#   {"name": "Client A", "tickers": ["AAPL", "MSFT"], "weights": [0.6, 0.4],
+#    "start_date": "2023-01-01", "end_date": "2024-01-01",
+#    "market": "S&P 500", "risk_free_rate": 0.01}
+# where "name", "market" and "risk_free_rate" are optional. --metrics writes per-stage timings and
+# fetch counts as JSON, or as Prometheus text when the file name ends in .prom.
+
+
+def load_specs(path):
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def evaluate_spec(spec, provider, default_market='S&P 500', default_risk_free_rate=0.01, profiler=None):
+    """
+    Evaluate one spec: selected portfolio metrics, the exact max-Sharpe and minimum-variance
+    portfolios and CAPM alpha/beta. Failures are reported in the 'error' field instead of raising.
+    With a profiler, each step is timed and the provider's fetches are logged on it.
+    """
+    stage = profiler.stage if profiler else lambda name: contextlib.nullcontext()
+    if profiler:
+        provider = profiler.instrument(provider)
+    row = {'name': spec.get('name', ','.join(spec.get('tickers', [])))}
+    try:
+        tickers = list(spec['tickers'])
+        weights = np.asarray(spec['weights'], dtype=float)
+        weights = weights / weights.sum()
+        risk_free_rate = spec.get('risk_free_rate', default_risk_free_rate)
+        with stage("Step 1: Fetch data"):
+            context = core.build_analysis_context(
+                tickers, weights, spec['start_date'], spec['end_date'],
+                spec.get('market', default_market), risk_free_rate, provider
+            )
+
+        with stage("Step 3b: Exact frontier"):
+            results, weights_record = core.exact_frontier(context.mean_returns, context.cov_matrix, risk_free_rate=risk_free_rate)
+            context.set_frontier(results, weights_record)
+        min_var_idx = np.argmin(results[0])
+        max_sharpe_idx = np.argmax(results[2])
+
+        with stage("Step 2: Portfolio performance"):
+            selected_return, selected_std_dev, selected_sharpe = core.portfolio_performance(
+                context.weights, context.mean_returns, context.cov_matrix, risk_free_rate
+            )
+        with stage("Step 8: Alpha and beta"):
+            selected_alpha, selected_beta = core.calculate_alpha_beta(context.selected_portfolio_returns, context.market_returns, risk_free_rate)
+            optimized_alpha, optimized_beta = core.calculate_alpha_beta(context.optimized_portfolio_returns, context.market_returns, risk_free_rate)
+
+        row.update({
+            'selected_return': selected_return,
+            'selected_volatility': selected_std_dev,
+            'selected_sharpe': selected_sharpe,
+            'selected_alpha': selected_alpha,
+            'selected_beta': selected_beta,
+            'optimized_return': results[1, max_sharpe_idx],
+            'optimized_volatility': results[0, max_sharpe_idx],
+            'optimized_sharpe': results[2, max_sharpe_idx],
+            'optimized_alpha': optimized_alpha,
+            'optimized_beta': optimized_beta,
+            'optimized_weights': core.format_weights(context.optimized_weights, tickers),
+            'min_variance_return': results[1, min_var_idx],
+            'min_variance_volatility': results[0, min_var_idx],
+            'min_variance_weights': core.format_weights(weights_record[min_var_idx], tickers),
+            'error': None
+        })
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+# The provider is sent to each worker once at start-up rather than pickled with every spec
+_worker_provider = None
+
+
+def _init_worker(provider):
+    global _worker_provider
+    _worker_provider = provider
+
+
+def _evaluate(args):
+    # Workers profile each spec separately and hand the stats back for the parent to merge
+    spec, default_market, default_risk_free_rate, track_memory = args
+    if track_memory is None:
+        return evaluate_spec(spec, _worker_provider, default_market, default_risk_free_rate), None
+    # Pooled workers are reused, so tracing must not outlive the spec
+    with Profiler(track_memory) as profiler:
+        row = evaluate_spec(spec, _worker_provider, default_market, default_risk_free_rate, profiler)
+    return row, profiler.to_dict()
+
+
+def prefetch(specs, provider, default_market):
+    # Fill the shared disk cache once per date range so workers don't download the same symbols
+    ranges = {}
+    for spec in specs:
+        symbols = ranges.setdefault((spec['start_date'], spec['end_date']), set())
+        symbols.update(spec.get('tickers', []))
+        symbols.add(core.market_options.get(spec.get('market', default_market), ''))
+    for (start_date, end_date), symbols in ranges.items():
+        provider.get_closes(sorted(symbol for symbol in symbols if symbol), start_date, end_date)
+
+
+def run_batch(specs, provider, workers=None, default_market='S&P 500', default_risk_free_rate=0.01, profiler=None):
+    """
+    Evaluate every spec and return one row per spec. Stage and fetch statistics from all
+    workers are merged into `profiler` when one is given.
+    """
+    if workers == 1:
+        return pd.DataFrame([evaluate_spec(spec, provider, default_market, default_risk_free_rate, profiler) for spec in specs])
+    tasks = [(spec, default_market, default_risk_free_rate, profiler.track_memory if profiler else None) for spec in specs]
+    chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(provider,)) as pool:
+        outputs = list(pool.map(_evaluate, tasks, chunksize=chunksize))
+    for _, stats in outputs:
+        if stats is not None:
+            profiler.merge(stats)
+    return pd.DataFrame([row for row, _ in outputs])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate many portfolio specs without the web UI.")
+    parser.add_argument('specs', help="JSON or JSON Lines file of portfolio specs")
+    parser.add_argument('--output', default='batch-results.csv', help="Output file (.csv, .json or .parquet)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--market', default='S&P 500', choices=sorted(core.market_options), help="Default market index")
+    parser.add_argument('--risk-free-rate', type=float, default=0.01, help="Default annual risk-free rate")
+    parser.add_argument('--data', default=None, help="Read prices from a local CSV/Parquet file or directory instead of Yahoo Finance")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Price cache directory")
+    parser.add_argument('--offline', action='store_true', help="Serve prices from the cache only")
+    parser.add_argument('--metrics', default=None, help="Write per-stage timings and fetch counts (.json, or .prom for Prometheus text)")
+    parser.add_argument('--track-memory', action='store_true', help="Also record peak memory per stage in --metrics (slower)")
+    args = parser.parse_args(argv)
+
+    profiler = Profiler(args.track_memory) if args.metrics else None
+    specs = load_specs(args.specs)
+    if args.data:
+        provider = LocalFileProvider(args.data)
+    else:
+        provider = PriceCache(args.cache_dir, offline=args.offline)
+        if not args.offline:
+            if profiler:
+                # Only the prefetch downloads run in this process, so only they can be logged here;
+                # the plain downloader is restored before the provider is sent to the workers
+                downloader = provider.downloader
+                provider.downloader = profiler.wrap_fetch(downloader, 'download')
+                with profiler.stage("Prefetch"):
+                    prefetch(specs, provider, args.market)
+                provider.downloader = downloader
+            else:
+                prefetch(specs, provider, args.market)
+
+    results = run_batch(specs, provider, args.workers, args.market, args.risk_free_rate, profiler)
+    if args.output.endswith('.parquet'):
+        results.to_parquet(args.output, index=False)
+    elif args.output.endswith('.json'):
+        results.to_json(args.output, orient='records', indent=2)
+    else:
+        results.to_csv(args.output, index=False)
+
+    if profiler:
+        with open(args.metrics, 'w') as f:
+            f.write(profiler.to_prometheus() if args.metrics.endswith('.prom') else profiler.to_json())
+
+    failed = results['error'].notna().sum()
+    print(f"Evaluated {len(results)} portfolios ({failed} failed) -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+import pandas as pd
+
+import portfolio_core as core
+
+# Benchmark suite for the pipeline stages, run on synthetic market data (no network).
+#
+#   python benchmark.py --save-baseline benchmark-baseline.json
+#   python benchmark.py --baseline benchmark-baseline.json --fail-on-regression
+#
+# Each stage is timed over a grid of ticker counts x portfolio counts; grid cells whose weight
+# matrix would exceed --max-cells values are skipped so the large sizes stay within memory.
+
+QUICK_GRID = {'tickers': [5, 50, 200], 'portfolios': [100, 10_000, 100_000]}
+FULL_GRID = {'tickers': [5, 50, 200, 1000], 'portfolios': [100, 10_000, 100_000, 1_000_000]}
+
+
+def synthetic_returns(num_tickers, num_days=756, num_factors=3, seed=0):
+    """
+    Daily returns for num_tickers synthetic assets driven by a market factor plus a few sector
+    factors and idiosyncratic noise, and the matching market return series.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2020-01-01', periods=num_days, name='Date')
+    market = rng.normal(4e-4, 0.01, num_days)
+    factors = rng.normal(0, 0.006, (num_days, num_factors))
+    betas = rng.uniform(0.5, 1.5, num_tickers)
+    loadings = rng.normal(0, 1, (num_factors, num_tickers))
+    noise = rng.normal(1e-4, 0.012, (num_days, num_tickers))
+    returns = np.outer(market, betas) + factors @ loadings + noise
+    tickers = [f"T{i:04d}" for i in range(num_tickers)]
+    return pd.DataFrame(returns, index=dates, columns=tickers), pd.Series(market, index=dates, name='Market')
+
+
+def _stages():
+    # Each stage takes the prepared inputs for one grid cell and returns a zero-argument callable to time
+    def frontier(data):
+        return lambda: core.efficient_frontier(data['mean_returns'], data['cov_matrix'], data['num_portfolios'], 0.01, dtype=data['dtype'])
+
+    def sharded(data):
+        return lambda: core.sharded_efficient_frontier(data['mean_returns'], data['cov_matrix'], data['num_portfolios'], 0.01, seed=0, dtype=data['dtype'])
+
+    def exact(data):
+        return lambda: core.exact_frontier(data['mean_returns'], data['cov_matrix'], risk_free_rate=0.01)
+
+    def performance(data):
+        weights = data['weights_record'][0]
+        return lambda: core.portfolio_performance(weights, data['mean_returns'], data['cov_matrix'], 0.01)
+
+    def plot(data):
+        import charts
+
+        return lambda: charts.plot_efficient_frontier(
+            data['results'], data['weights_record'], data['weights_record'][0], 0.1, 0.2, data['tickers']
+        )
+
+    def summary(data):
+        def build():
+            core.build_portfolio_summary(data['results'], data['weights_record'], data['tickers'])
+            candidates = core.filter_portfolios(data['results'])
+            core.sharpe_ranked_page(data['results'], data['weights_record'], data['tickers'], candidates, 0, 50)
+        return build
+
+    def alpha_beta(data):
+        portfolio_returns = data['returns'] @ data['weights_record'][0]
+        return lambda: core.calculate_alpha_beta(portfolio_returns.copy(), data['market_returns'].copy(), 0.01)
+
+    def correlation(data):
+        return lambda: data['returns'].corr()
+
+    return {
+        'efficient_frontier': (frontier, True),
+        'sharded_efficient_frontier': (sharded, True),
+        'exact_frontier': (exact, False),
+        'portfolio_performance': (performance, False),
+        'plot_efficient_frontier': (plot, True),
+        'portfolio_summary_table': (summary, True),
+        'calculate_alpha_beta': (alpha_beta, False),
+        'display_correlation_matrix': (correlation, False),
+    }
+
+
+def _time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run_benchmarks(grid, stages=None, repeat=3, num_days=756, max_cells=50_000_000, dtype='float64'):
+    """
+    Time every stage over the grid and return a list of result records (best of `repeat` runs).
+    Stages that don't depend on the number of portfolios are timed once per ticker count.
+    `dtype` is the storage type of the sampled weights matrix.
+    """
+    all_stages = _stages()
+    selected = {name: all_stages[name] for name in (stages or all_stages)}
+    records = []
+    for num_tickers in grid['tickers']:
+        returns, market_returns = synthetic_returns(num_tickers, num_days)
+        data = {
+            'returns': returns,
+            'market_returns': market_returns,
+            'tickers': list(returns.columns),
+            'mean_returns': returns.mean(),
+            'cov_matrix': returns.cov(),
+            'dtype': dtype,
+        }
+        timed_once = set()
+        for num_portfolios in grid['portfolios']:
+            if num_tickers * num_portfolios > max_cells:
+                continue
+            np.random.seed(0)
+            data['num_portfolios'] = num_portfolios
+            data['results'], data['weights_record'] = core.efficient_frontier(data['mean_returns'], data['cov_matrix'], num_portfolios, 0.01, dtype=dtype)
+            for name, (prepare, depends_on_portfolios) in selected.items():
+                if not depends_on_portfolios and name in timed_once:
+                    continue
+                timed_once.add(name)
+                try:
+                    seconds = _time(prepare(data), repeat)
+                except ImportError as e:
+                    print(f"Skipping {name}: {e}")
+                    continue
+                records.append({
+                    'stage': name,
+                    'tickers': num_tickers,
+                    'portfolios': num_portfolios if depends_on_portfolios else None,
+                    'dtype': dtype,
+                    'seconds': seconds
+                })
+                print(f"{name:28s} tickers={num_tickers:<5d} portfolios={num_portfolios if depends_on_portfolios else '-':<8} {seconds * 1000:10.2f} ms")
+    return records
+
+
+def compare_to_baseline(records, baseline_records, tolerance=0.25, min_seconds=0.001):
+    """
+    Return the records that got slower than the baseline by more than `tolerance` (relative)
+    and `min_seconds` (absolute), each with the baseline time and the slowdown ratio.
+    """
+    def key(record):
+        return record['stage'], record['tickers'], record['portfolios'], record.get('dtype', 'float64')
+
+    baseline = {key(r): r['seconds'] for r in baseline_records}
+    regressions = []
+    for record in records:
+        previous = baseline.get(key(record))
+        if previous is None:
+            continue
+        if record['seconds'] > previous * (1 + tolerance) and record['seconds'] - previous > min_seconds:
+            regressions.append(dict(record, baseline_seconds=previous, ratio=record['seconds'] / previous))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the portfolio pipeline stages on synthetic data.")
+    parser.add_argument('--full', action='store_true', help="Use the full grid (up to 1000 tickers and 1M portfolios)")
+    parser.add_argument('--tickers', type=int, nargs='+', help="Override the ticker counts")
+    parser.add_argument('--portfolios', type=int, nargs='+', help="Override the portfolio counts")
+    parser.add_argument('--stages', nargs='+', choices=sorted(_stages()), help="Only run these stages")
+    parser.add_argument('--days', type=int, default=756, help="Synthetic trading days per ticker")
+    parser.add_argument('--float32', action='store_true', help="Store sampled weights in single precision")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement (best is kept)")
+    parser.add_argument('--max-cells', type=float, default=5e7, help="Skip grid cells with more tickers x portfolios than this")
+    parser.add_argument('--output', default='benchmark-results.json', help="Where to write this run's results")
+    parser.add_argument('--save-baseline', help="Also write the results to this baseline file")
+    parser.add_argument('--baseline', help="Compare against this baseline file and report regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before flagging a regression")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 when a regression is found")
+    args = parser.parse_args(argv)
+
+    grid = dict(FULL_GRID if args.full else QUICK_GRID)
+    if args.tickers:
+        grid['tickers'] = args.tickers
+    if args.portfolios:
+        grid['portfolios'] = args.portfolios
+
+    records = run_benchmarks(grid, args.stages, args.repeat, args.days, args.max_cells, 'float32' if args.float32 else 'float64')
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': records
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(records, json.load(f)['results'], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['stage']} tickers={regression['tickers']} portfolios={regression['portfolios']}: "
+                  f"{regression['baseline_seconds'] * 1000:.2f} ms -> {regression['seconds'] * 1000:.2f} ms ({regression['ratio']:.2f}x)")
+        if not regressions:
+            print("No regressions against the baseline.")
+        if regressions and args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
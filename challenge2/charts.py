@@ -0,0 +1,98 @@
+import numpy as np
+import plotly.graph_objs as go
+
+from portfolio_core import decimate_frontier
+
+# Plotly figure builders for the portfolio analysis tool. They only build figures (no Streamlit
+# calls), so example.py can memoize and display them and benchmark.py can time them headlessly.
+
+# Step 4: Plot Efficient Frontier and Custom Portfolio
+def portfolio_hovertemplate(tickers):
+    # Weights and Sharpe ratio are read from customdata in the browser instead of pre-formatted strings
+    portfolio_info = [f"{ticker}: %{{customdata[{i}]:.2%}}" for i, ticker in enumerate(tickers)]
+    return (
+        f"Portfolio Weights:<br>{'<br>'.join(portfolio_info)}<br>"
+        "Return: %{y:.2%}<br>"
+        "Volatility: %{x:.2%}<br>"
+        f"Sharpe Ratio: %{{customdata[{len(tickers)}]:.2f}}<extra></extra>"
+    )
+
+def portfolio_customdata(results, weights_record, indices):
+    # Gathers only the plotted rows of the weights matrix
+    return np.column_stack([np.asarray(weights_record)[indices].reshape(len(indices), -1), results[2, indices]])
+
+def plot_efficient_frontier(results, weights_record, custom_weights, custom_return, custom_std_dev, tickers, frontier=None, max_points=5000,
+                            color_values=None, color_label='Sharpe Ratio', risk_free_rate=0.01):
+    traces = []
+    hovertemplate = portfolio_hovertemplate(tickers)
+
+    # Monte Carlo cloud (optional when an exact frontier is supplied), decimated to bound the payload.
+    # It is coloured by Sharpe ratio unless color_values (e.g. a realized metric per portfolio) is given.
+    if results is not None:
+        indices = decimate_frontier(results, max_points)
+        colors = results[2, indices] if color_values is None else np.asarray(color_values)[indices]
+        traces.append(go.Scattergl(
+            x=results[0, indices], y=results[1, indices],
+            mode='markers',
+            marker=dict(color=colors, size=5, showscale=True, colorbar=dict(title=color_label)),
+            name='Efficient Frontier' if frontier is None else 'Sampled Portfolios',
+            customdata=portfolio_customdata(results, weights_record, indices),
+            hovertemplate=hovertemplate if color_values is None else hovertemplate.replace(
+                '<extra></extra>', f'<br>{color_label}: %{{marker.color:.4f}}<extra></extra>')
+        ))
+
+    # Exact frontier curve from exact_frontier
+    if frontier is not None:
+        frontier_results, frontier_weights = frontier
+        traces.append(go.Scatter(
+            x=frontier_results[0, :], y=frontier_results[1, :],
+            mode='lines+markers',
+            line=dict(color='black', width=2),
+            marker=dict(size=4),
+            name='Efficient Frontier',
+            customdata=portfolio_customdata(frontier_results, frontier_weights, np.arange(frontier_results.shape[1])),
+            hovertemplate=hovertemplate
+        ))
+
+    custom_portfolio_info = [f"{ticker}: {weight:.2%}" for ticker, weight in zip(tickers, custom_weights)]
+    custom_hover_text = (
+        f"Custom Portfolio:<br>{'<br>'.join(custom_portfolio_info)}<br>"
+        f"Return: {custom_return:.2%}<br>"
+        f"Volatility: {custom_std_dev:.2%}<br>"
+        f"Sharpe Ratio: {(custom_return - risk_free_rate) / custom_std_dev:.2f}"
+    )
+
+    trace2 = go.Scatter(
+        x=[custom_std_dev], y=[custom_return],
+        mode='markers',
+        marker=dict(color='red', size=12, symbol='star'),
+        name='Custom Portfolio',
+        text=[custom_hover_text],
+        hoverinfo='text'
+    )
+
+    layout = go.Layout(
+        title='Efficient Frontier with Custom Portfolio',
+        xaxis=dict(title='Volatility (Std Dev)'),
+        yaxis=dict(title='Return'),
+        showlegend=True
+    )
+
+    fig = go.Figure(data=traces + [trace2], layout=layout)
+    return fig
+
+# Step 11: Monte Carlo projection fan chart
+def plot_projection_fan(fan, title):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=fan.index, y=fan['P95'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=fan.index, y=fan['P5'], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(204, 153, 0, 0.2)', name='5th-95th Percentile'))
+    fig.add_trace(go.Scatter(x=fan.index, y=fan['P75'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=fan.index, y=fan['P25'], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(204, 153, 0, 0.4)', name='25th-75th Percentile'))
+    fig.add_trace(go.Scatter(x=fan.index, y=fan['P50'], mode='lines', line=dict(color='rgb(204, 153, 0)'), name='Median'))
+    fig.update_layout(
+        title=title,
+        xaxis_title='Trading Days Ahead',
+        yaxis_title='Value of $1 Invested',
+        template='plotly_white'
+    )
+    return fig
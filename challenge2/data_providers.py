@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+
+# Price data providers. Any object with a get_closes(symbols, start, end) method that returns
+# closing prices over [start, end) as a DataFrame (one column per symbol, tz-naive date index)
+# can feed the analysis. Symbols without prices are left out and may be listed with the reason in
+# the result's attrs['failures']. PriceCache (price_cache.py) is the Yahoo Finance backed provider;
+# LocalFileProvider below reads prices from disk so the tool runs without network access.
+
+
+class LocalFileProvider:
+    """
+    Serve closing prices from local CSV or Parquet files.
+    `path` is either a single wide file (a Date column plus one column per symbol) or a directory
+    holding one <SYMBOL>.csv / <SYMBOL>.parquet file per symbol with Date and Close columns.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._wide = _read_prices(path) if os.path.isfile(path) else None
+
+    def memo_key(self):
+        # Any edit to the source files changes the key so memoized results are refreshed
+        if os.path.isdir(self.path):
+            return (self.path, max((entry.stat().st_mtime for entry in os.scandir(self.path)), default=0))
+        return (self.path, os.path.getmtime(self.path) if os.path.exists(self.path) else 0)
+
+    def _read_symbol(self, symbol):
+        for extension in ('.parquet', '.csv'):
+            path = os.path.join(self.path, symbol + extension)
+            if os.path.exists(path):
+                return _read_prices(path)['Close'].rename(symbol)
+        return None
+
+    def get_closes(self, symbols, start, end):
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        if self._wide is not None:
+            columns = {symbol: self._wide[symbol] for symbol in symbols if symbol in self._wide.columns}
+        else:
+            columns = {symbol: series for symbol in symbols if (series := self._read_symbol(symbol)) is not None}
+        closes = pd.DataFrame(columns, index=None if columns else pd.DatetimeIndex([], name='Date'))
+        closes = closes.loc[(closes.index >= pd.Timestamp(start)) & (closes.index < pd.Timestamp(end))]
+        closes.attrs['failures'] = {symbol: f"not found in {self.path}" for symbol in symbols if symbol not in columns}
+        return closes
+
+
+def _read_prices(path):
+    if path.endswith('.parquet'):
+        prices = pd.read_parquet(path)
+    else:
+        prices = pd.read_csv(path)
+    if 'Date' in prices.columns:
+        prices = prices.set_index('Date')
+    prices.index = pd.DatetimeIndex(pd.to_datetime(prices.index)).tz_localize(None).normalize()
+    prices.index.name = 'Date'
+    return prices.sort_index()
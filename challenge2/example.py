@@ -1,9 +1,16 @@
-import numpy as np
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objs as go
 import streamlit as st
 import io
+import time
+import portfolio_core as core
+from portfolio_core import portfolio_performance, build_portfolio_summary, filter_portfolios, sharpe_ranked_page, calculate_alpha_beta
+from price_cache import PriceCache
+from data_providers import LocalFileProvider
+from memo import memoize, default_store, stable_hash
+from profiling import Profiler
+from charts import plot_projection_fan
+import charts
 
 # Author tag
 AUTHOR_URL = "https://www.linkedin.com/in/alex-elguezabal/"
@@ -45,178 +52,121 @@ This tool empowers users to optimize portfolios, manage risk, and make informed
 '''
 st.markdown(mk)
 
-# Dropdown to select the market index for comparison
-market_options = {
-    "S&P 500": "^GSPC",
-    "DJIA": "^DJI",
-    "Russell 1000": "^RUI",
-    "NASDAQ": "^IXIC"
-}
-
-# Step 1: Fetch historical stock prices with error handling
-def get_data(tickers, start_date, end_date):
+# Local price cache shared by get_data and the market index downloads (only missing date ranges are fetched)
+price_cache = PriceCache()
+
+# Steps 1-3: the math lives in portfolio_core; these wrappers add memoization and UI error reporting
+# Partially failed downloads are not memoized so the failed tickers are retried on the next run
+get_data = memoize(cache_if=lambda returns: not returns.attrs.get('failures'))(core.get_data)
+efficient_frontier = memoize()(core.efficient_frontier)
+sharded_efficient_frontier = memoize()(core.sharded_efficient_frontier)
+exact_frontier = memoize()(core.exact_frontier)
+walk_forward_backtest = memoize()(core.walk_forward_backtest)
+frontier_realized_metrics = memoize()(core.frontier_realized_metrics)
+simulate_portfolio_paths = memoize()(core.simulate_portfolio_paths)
+plot_efficient_frontier = memoize()(charts.plot_efficient_frontier)
+
+def build_analysis_context(tickers, weights, start_date, end_date, market_name, risk_free_rate, provider=None, cov_method='sample', num_factors=5):
     try:
-        data = yf.download(tickers, start=start_date, end=end_date, auto_adjust=True)['Close']
-        returns = data.pct_change().dropna()
-        return returns
+        return core.build_analysis_context(tickers, weights, start_date, end_date, market_name, risk_free_rate, provider or price_cache,
+                                           fetch=get_data, cov_method=cov_method, num_factors=num_factors, allow_partial=True)
     except Exception as e:
         st.error(f"Error fetching data: {str(e)}")
         return None
 
-# Step 2: Portfolio performance calculations with adjustable risk-free rate
-def portfolio_performance(weights, mean_returns, cov_matrix, risk_free_rate):
-    # Annualize returns and volatility
-    annualized_return = np.sum(mean_returns * weights) * 252  # Annualizing daily returns
-    annualized_std_dev = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights))) * np.sqrt(252)  # Annualizing volatility
-    sharpe_ratio = (annualized_return - risk_free_rate) / annualized_std_dev
-    return annualized_return, annualized_std_dev, sharpe_ratio
-
-# Step 3: Compute Efficient Frontier
-def efficient_frontier(mean_returns, cov_matrix, num_portfolios=100, risk_free_rate=0.01):
-    num_assets = len(mean_returns)
-    results = np.zeros((3, num_portfolios))
-    weights_record = []
-
-    for i in range(num_portfolios):
-        weights = np.random.random(num_assets)
-        weights /= np.sum(weights)
-        returns, std_dev, sharpe_ratio = portfolio_performance(weights, mean_returns, cov_matrix, risk_free_rate)
-        results[0, i] = std_dev
-        results[1, i] = returns
-        results[2, i] = sharpe_ratio  # Sharpe Ratio
-        weights_record.append(weights)
-
-    return results, weights_record
-
-# Step 4: Plot Efficient Frontier and Custom Portfolio
-def plot_efficient_frontier(results, weights_record, custom_weights, custom_return, custom_std_dev, tickers):
-    hover_texts = []
-    for i, weights in enumerate(weights_record):
-        portfolio_info = [f"{ticker}: {weight:.2%}" for ticker, weight in zip(tickers, weights)]
-        hover_text = (
-            f"Portfolio Weights:<br>{'<br>'.join(portfolio_info)}<br>"
-            f"Return: {results[1, i]:.2%}<br>"
-            f"Volatility: {results[0, i]:.2%}<br>"
-            f"Sharpe Ratio: {results[2, i]:.2f}"
+# Step 3: Stream the Monte Carlo frontier into the page chunk by chunk
+def stream_efficient_frontier(mean_returns, cov_matrix, num_portfolios, risk_free_rate, sampler, dtype, patience,
+                              custom_weights, custom_return, custom_std_dev, tickers):
+    """
+    Sample the frontier with a live progress bar, running best-Sharpe / minimum-volatility stats and a
+    preview chart. "Stop Sampling" keeps the portfolios sampled so far (until the next Deploy) and a
+    completed or early-stopped run is memoized like efficient_frontier.
+    """
+    # Roughly 20 updates per run; the draws are the same for any chunk size
+    chunk_size = int(min(2048, max(256, num_portfolios // 20)))
+    args = (mean_returns, cov_matrix, num_portfolios, risk_free_rate)
+    kwargs = dict(chunk_size=chunk_size, sampler=sampler, dtype=dtype, patience=patience)
+    hit, value = efficient_frontier.lookup(*args, **kwargs)
+    if hit:
+        return value
+
+    run_key = stable_hash((args, kwargs))
+    stop_placeholder = st.empty()
+    stop_requested = stop_placeholder.button("Stop Sampling", key="stop_sampling")
+    partial = st.session_state.get("frontier_partial")
+    if partial is not None and partial["key"] == run_key and (partial["cancelled"] or stop_requested):
+        partial["cancelled"] = True
+        stop_placeholder.empty()
+        st.info(f"Sampling was stopped after {partial['results'].shape[1]:,} of {num_portfolios:,} portfolios.")
+        return partial["results"], partial["weights_record"]
+
+    progress = st.progress(0.0)
+    status = st.empty()
+    preview = st.empty()
+    last_draw = 0.0
+    for results, weights_record, stats in core.iter_efficient_frontier(*args, **kwargs):
+        # Views of the arrays filled so far, kept in case the user stops the run
+        st.session_state.frontier_partial = {"key": run_key, "results": results, "weights_record": weights_record, "cancelled": False}
+        progress.progress(stats['done'] / stats['total'])
+        status.caption(
+            f"{stats['done']:,} of {stats['total']:,} portfolios sampled, best Sharpe Ratio {stats['best_sharpe']:.3f}, "
+            f"minimum volatility {stats['min_volatility']:.2%}"
         )
-        hover_texts.append(hover_text)
-
-    trace1 = go.Scatter(
-        x=results[0, :], y=results[1, :],
-        mode='markers',
-        marker=dict(color=results[2, :], size=5, showscale=True),
-        name='Efficient Frontier',
-        text=hover_texts,
-        hoverinfo='text'
-    )
-
-    custom_portfolio_info = [f"{ticker}: {weight:.2%}" for ticker, weight in zip(tickers, custom_weights)]
-    custom_hover_text = (
-        f"Custom Portfolio:<br>{'<br>'.join(custom_portfolio_info)}<br>"
-        f"Return: {custom_return:.2%}<br>"
-        f"Volatility: {custom_std_dev:.2%}<br>"
-        f"Sharpe Ratio: {(custom_return - risk_free_rate) / custom_std_dev:.2f}"
-    )
-
-    trace2 = go.Scatter(
-        x=[custom_std_dev], y=[custom_return],
-        mode='markers',
-        marker=dict(color='red', size=12, symbol='star'),
-        name='Custom Portfolio',
-        text=[custom_hover_text],
-        hoverinfo='text'
-    )
-
-    layout = go.Layout(
-        title='Efficient Frontier with Custom Portfolio',
-        xaxis=dict(title='Volatility (Std Dev)'),
-        yaxis=dict(title='Return'),
-        showlegend=True
-    )
-
-    fig = go.Figure(data=[trace1, trace2], layout=layout)
-    return fig
+        if time.perf_counter() - last_draw > 1.0:
+            preview.plotly_chart(charts.plot_efficient_frontier(results, weights_record, custom_weights, custom_return, custom_std_dev, tickers,
+                                                                max_points=2000, risk_free_rate=risk_free_rate),
+                                 key=f"frontier_preview_{stats['done']}")
+            last_draw = time.perf_counter()
+
+    for placeholder in (stop_placeholder, progress, status, preview):
+        placeholder.empty()
+    if stats['stopped_early']:
+        st.caption(f"Sampling stopped early after {stats['done']:,} portfolios: the best Sharpe Ratio did not improve for {patience} chunks.")
+    efficient_frontier.remember((results, weights_record), *args, **kwargs)
+    return results, weights_record
 
 # Step 5: Portfolio Summary Table
 def portfolio_summary_table(results, weights_record, tickers):
-    max_sharpe_idx = np.argmax(results[2])
-    min_var_idx = np.argmin(results[0])
-
-    summary_data = {
-        'Portfolio': ['Maximum Sharpe Ratio (Optimized Portfolio)', 'Minimum Variance'],
-        'Expected Annual Return': [results[1, max_sharpe_idx], results[1, min_var_idx]],
-        'Expected Volatility': [results[0, max_sharpe_idx], results[0, min_var_idx]],
-        'Sharpe Ratio': [results[2, max_sharpe_idx], results[2, min_var_idx]],
-        'Weights': [weights_record[max_sharpe_idx], weights_record[min_var_idx]]
-    }
-    summary_df = pd.DataFrame(summary_data)
-
-    summary_df['Weights'] = summary_df['Weights'].apply(lambda w: ', '.join([f"{tickers[i]}: {w[i]:.2%}" for i in range(len(w))]))
+    summary_df = build_portfolio_summary(results, weights_record, tickers)
 
     st.subheader("Portfolio Summary: Efficient Frontier")
 
-    #####################################################
-    #
-    #   Sharpe Ratio Dataframe
-    #
-    #####################################################
-
-    # Create a DataFrame to store portfolio statistics
-    summary_sharpe_df = pd.DataFrame({
-        'Expected Annual Return': results[1],
-        'Expected Volatility': results[0],
-        'Sharpe Ratio': results[2],
-        'Weights': weights_record
-    })
-
-    # Sort by Sharpe Ratio in descending order
-    summary_sharpe_df = summary_sharpe_df.sort_values(by='Sharpe Ratio', ascending=False).reset_index(drop=True)
-
-    # Convert weights to readable format
-    summary_sharpe_df['Weights'] = summary_sharpe_df['Weights'].apply(
-        lambda w: ', '.join([f"{tickers[i]}: {w[i]:.2%}" for i in range(len(w))])
-    )
-
     summary, sharp_ratio = st.tabs(["🗃 Summary", "📈 Sharp Ratio Data"])
     
     summary.subheader("Summary of Efficient Frontier")
     summary.write(summary_df)    
     sharp_ratio.subheader("Portfolios sorted by Sharpe Ratio")
-    sharp_ratio.dataframe(summary_sharpe_df.style.format({"Expected Annual Return": "{:.2%}", 
+
+    # Optional filters (in percent) and paging controls
+    filter_return, filter_volatility, page_size_col = sharp_ratio.columns(3)
+    min_return = filter_return.number_input("Minimum Return (%)", value=None, key="summary_min_return")
+    max_volatility = filter_volatility.number_input("Maximum Volatility (%)", value=None, key="summary_max_volatility")
+    page_size = page_size_col.selectbox("Rows per Page", (25, 50, 100, 250), index=1, key="summary_page_size")
+
+    candidates = filter_portfolios(results,
+                                   None if min_return is None else min_return / 100,
+                                   None if max_volatility is None else max_volatility / 100)
+    num_pages = max(1, -(-len(candidates) // page_size))
+    page = sharp_ratio.number_input(f"Page (of {num_pages}, {len(candidates)} portfolios)", min_value=1, max_value=num_pages, value=1, key="summary_page")
+
+    page_df = sharpe_ranked_page(results, weights_record, tickers, candidates, page - 1, page_size)
+    sharp_ratio.dataframe(page_df.style.format({"Expected Annual Return": "{:.2%}", 
                                           "Expected Volatility": "{:.2%}", 
                                           "Sharpe Ratio": "{:.4f}"}))
 
 # Step 6: Correlation Matrix Display
-def display_correlation_matrix(returns, tickers):
-    correlation_matrix = returns.corr()
-    st.write(correlation_matrix)
+def display_correlation_matrix(context):
+    st.write(context.corr_matrix)
 
 # Step 7: Portfolio & Optimized Portfolio Backtest
-def portfolio_backtest(results, weights_record, selected_weights, tickers, start_date, end_date):
-    max_sharpe_idx = np.argmax(results[2])
-    # Fetch historical data for the selected portfolio
-    selected_portfolio_returns = get_data(tickers, start_date, end_date)
-    weighted_portfolio_returns = (selected_portfolio_returns * selected_weights).sum(axis=1)
-    optimized_portfolio_weights = weights_record[max_sharpe_idx]
-    weighted_optimized_portfolio_returns = (selected_portfolio_returns * optimized_portfolio_weights).sum(axis=1)
-
-    # Convert portfolio returns index to timezone-naive
-    weighted_portfolio_returns.index = weighted_portfolio_returns.index.tz_localize(None)
-    weighted_optimized_portfolio_returns.index = weighted_optimized_portfolio_returns.index.tz_localize(None)
-
-    # Fetch historical data for the selected market index
-    market_symbol = market_options[selected_market]
-    market_data = yf.download(market_symbol, start=start_date, end=end_date, auto_adjust=True)['Close']
-    market_returns = market_data.pct_change().dropna().squeeze()
-
-    # Convert market returns index to timezone-naive
-    market_returns.index = market_returns.index.tz_localize(None)
+def portfolio_backtest(context):
+    market_name = context.market_name
 
     # Create comparison DataFrame
     comparison_df = pd.DataFrame({
-        'Optimized Portfolio': weighted_optimized_portfolio_returns,
-        'Selected Portfolio': weighted_portfolio_returns,
-        selected_market: market_returns
+        'Optimized Portfolio': context.optimized_portfolio_returns,
+        'Selected Portfolio': context.selected_portfolio_returns,
+        market_name: context.market_returns
     })
 
     # Drop rows with NaN values that may arise due to date mismatches
@@ -226,10 +176,10 @@ def portfolio_backtest(results, weights_record, selected_weights, tickers, start
     comparison_fig = go.Figure()
     comparison_fig.add_trace(go.Scatter(x=comparison_df.index, y=comparison_df['Optimized Portfolio'], mode='lines', name='Optimized Portfolio'))
     comparison_fig.add_trace(go.Scatter(x=comparison_df.index, y=comparison_df['Selected Portfolio'], mode='lines', name='Selected Portfolio'))
-    comparison_fig.add_trace(go.Scatter(x=comparison_df.index, y=comparison_df[selected_market], mode='lines', name=selected_market))
+    comparison_fig.add_trace(go.Scatter(x=comparison_df.index, y=comparison_df[market_name], mode='lines', name=market_name))
 
     comparison_fig.update_layout(
-        title=f'Historical Returns: Optimized Portfolio vs Selected Portfolio vs {selected_market}',
+        title=f'Historical Returns: Optimized Portfolio vs Selected Portfolio vs {market_name}',
         xaxis_title='Date',
         yaxis_title='Cumulative Returns',
         legend_title='Legend',
@@ -245,16 +195,16 @@ def portfolio_backtest(results, weights_record, selected_weights, tickers, start
     # Calculate cumulative return as percentage
     optimized_portfolio_cumulative_return = (1 + comparison_df['Optimized Portfolio']).cumprod() - 1
     selected_portfolio_cumulative_return = (1 + comparison_df['Selected Portfolio']).cumprod() - 1
-    market_cumulative_return = (1 + comparison_df[selected_market]).cumprod() - 1
+    market_cumulative_return = (1 + comparison_df[market_name]).cumprod() - 1
 
     # Add traces for the cumulative return
     rate_of_return_fig.add_trace(go.Scatter(x=comparison_df.index, y=optimized_portfolio_cumulative_return * 100, mode='lines', name='Optimized Portfolio'))
     rate_of_return_fig.add_trace(go.Scatter(x=comparison_df.index, y=selected_portfolio_cumulative_return * 100, mode='lines', name='Selected Portfolio'))
-    rate_of_return_fig.add_trace(go.Scatter(x=comparison_df.index, y=market_cumulative_return * 100, mode='lines', name=selected_market))
+    rate_of_return_fig.add_trace(go.Scatter(x=comparison_df.index, y=market_cumulative_return * 100, mode='lines', name=market_name))
 
     # Update layout with appropriate titles and labels
     rate_of_return_fig.update_layout(
-        title=f'Historical Rate of Return (Cumulative Percentage): Optimized Portfolio vs Selected Portfolio vs {selected_market}',
+        title=f'Historical Rate of Return (Cumulative Percentage): Optimized Portfolio vs Selected Portfolio vs {market_name}',
         xaxis_title='Date',
         yaxis_title='Cumulative Return (%)',
         legend_title='Legend',
@@ -264,70 +214,66 @@ def portfolio_backtest(results, weights_record, selected_weights, tickers, start
     # Display historical rate of return plot
     st.plotly_chart(rate_of_return_fig)
 
-# Step 8: Calculate the R alpha using CAPM forumula, beta using slope of regression through volitilty.
-def calculate_alpha_beta(portfolio_returns, market_returns, risk_free_rate):
-    """
-    Calculate alpha and beta for a portfolio using the CAPM model.
-    Alpha is the excess return relative to the market, adjusted for risk-free rate.
-    Beta measures the systematic risk of the portfolio.
-    """
-    # Ensure both series are tz-naive
-    portfolio_returns.index = portfolio_returns.index.tz_localize(None)
-    market_returns.index = market_returns.index.tz_localize(None)
+# Step 7b: Walk-forward (out-of-sample) backtest with periodic re-optimization
+def display_walk_forward(context):
+    market_name = context.market_name
 
-    # Ensure both series have the same length and drop NaN values
-    combined_df = pd.concat([portfolio_returns, market_returns], axis=1).dropna()
-    portfolio_returns = combined_df.iloc[:, 0]
-    market_returns = combined_df.iloc[:, 1]
+    window_col, rebalance_col, mode_col, objective_col = st.columns(4)
+    window = window_col.number_input("Estimation Window (days)", min_value=20, value=min(252, max(20, len(context.returns) // 2)), step=1, key="walk_forward_window")
+    rebalance_every = rebalance_col.selectbox("Rebalance Every", (5, 21, 63, 126), index=1, format_func=lambda days: f"{days} days", key="walk_forward_rebalance")
+    mode = mode_col.selectbox("Window", ('Rolling', 'Expanding'), key="walk_forward_mode")
+    objective = objective_col.selectbox("Objective", ('Maximum Sharpe', 'Minimum Variance'), key="walk_forward_objective")
 
-    # Perform linear regression to calculate beta (slope) and alpha (intercept)
-    X = market_returns.values.reshape(-1, 1)  # Independent variable (market returns)
-    y = portfolio_returns.values              # Dependent variable (portfolio returns)
-    X = np.hstack([np.ones_like(X), X])       # Add column for intercept
-    coef = np.linalg.lstsq(X, y, rcond=None)[0]  # Solve for regression coefficients
-    intercept, beta = coef[0], coef[1]        # Intercept and slope from regression
+    if len(context.returns) <= window:
+        st.warning(f"The walk-forward backtest needs more than {window} days of returns.")
+        return
 
-    # Calculate average returns
-    R = portfolio_returns.sum()         # Portfolio return
-    Rm = market_returns.sum()          # Market return
+    walk_forward_returns, rebalance_weights = walk_forward_backtest(
+        context.returns, window, rebalance_every, mode == 'Expanding',
+        'min_variance' if objective == 'Minimum Variance' else 'max_sharpe', context.risk_free_rate
+    )
 
-    # Calculate alpha using the CAPM formula
-    alpha = (R - risk_free_rate) - beta * (Rm - risk_free_rate)
+    # Stitched out-of-sample equity curve next to the market index
+    comparison_df = pd.DataFrame({
+        'Walk-Forward Portfolio': walk_forward_returns,
+        market_name: context.market_returns
+    }).dropna()
+    cumulative_returns = (1 + comparison_df).cumprod() - 1
+
+    walk_forward_fig = go.Figure()
+    walk_forward_fig.add_trace(go.Scatter(x=comparison_df.index, y=cumulative_returns['Walk-Forward Portfolio'] * 100, mode='lines', name='Walk-Forward Portfolio'))
+    walk_forward_fig.add_trace(go.Scatter(x=comparison_df.index, y=cumulative_returns[market_name] * 100, mode='lines', name=market_name))
+    walk_forward_fig.update_layout(
+        title=f'Out-of-Sample Cumulative Return: Walk-Forward Portfolio vs {market_name}',
+        xaxis_title='Date',
+        yaxis_title='Cumulative Return (%)',
+        legend_title='Legend',
+        template='plotly_white'
+    )
+    st.plotly_chart(walk_forward_fig)
 
-    return alpha, beta
+    st.write("Weights at each rebalance")
+    st.dataframe(rebalance_weights.style.format("{:.2%}"))
 
 # Step 9: display the alpha and beta in a readable table
-def display_alpha_beta(results, weights_record, weights, tickers, start_date, end_date, risk_free_rate):
+def display_alpha_beta(context):
     """
     Calculate and display alpha and beta for the selected and optimized portfolios.
     """
-    # Fetch portfolio returns and market returns
-    returns = get_data(tickers, start_date, end_date)
-    if returns is not None:
-        selected_portfolio_returns = (returns * weights).sum(axis=1)
-        max_sharpe_idx = np.argmax(results[2])
-        optimized_weights = weights_record[max_sharpe_idx]
-        optimized_portfolio_returns = (returns * optimized_weights).sum(axis=1)
-
-        # Fetch market data
-        market_symbol = market_options[selected_market]
-        market_data = yf.download(market_symbol, start=start_date, end=end_date, auto_adjust=True)['Close']
-        market_returns = market_data.pct_change().dropna()
-
-        # Calculate alpha and beta for both portfolios
-        selected_alpha, selected_beta = calculate_alpha_beta(selected_portfolio_returns, market_returns, risk_free_rate)
-        optimized_alpha, optimized_beta = calculate_alpha_beta(optimized_portfolio_returns, market_returns, risk_free_rate)
-
-        # Create a DataFrame to display the results
-        data = {
-            "Portfolio": ["Selected Portfolio", "Optimized Portfolio"],
-            "Alpha": [selected_alpha, optimized_alpha],
-            "Beta": [selected_beta, optimized_beta]
-        }
-        summary_df = pd.DataFrame(data)
+    # Calculate alpha and beta for both portfolios
+    selected_alpha, selected_beta = calculate_alpha_beta(context.selected_portfolio_returns, context.market_returns, context.risk_free_rate)
+    optimized_alpha, optimized_beta = calculate_alpha_beta(context.optimized_portfolio_returns, context.market_returns, context.risk_free_rate)
+
+    # Create a DataFrame to display the results
+    data = {
+        "Portfolio": ["Selected Portfolio", "Optimized Portfolio"],
+        "Alpha": [selected_alpha, optimized_alpha],
+        "Beta": [selected_beta, optimized_beta]
+    }
+    summary_df = pd.DataFrame(data)
 
-        # Display the table
-        st.write(summary_df)
+    # Display the table
+    st.write(summary_df)
 
 # Step 10: Add graph for tickers most likely to be big performers in the next year
 def display_top_performers(mean_returns, tickers):
@@ -374,6 +320,27 @@ def display_top_performers(mean_returns, tickers):
 
     st.plotly_chart(fig)
 
+# Step 11: Forward Monte Carlo projection (percentile fan chart, VaR and CVaR)
+def display_monte_carlo_projection(context):
+    method_col, paths_col, horizon_col, seed_col = st.columns(4)
+    method = method_col.selectbox("Return Model", ('Correlated Normal', 'Historical Bootstrap'), key="projection_method")
+    num_paths = paths_col.selectbox("Simulated Paths", (1000, 10000, 100000), index=1, key="projection_paths")
+    horizon = horizon_col.number_input("Horizon (trading days)", min_value=1, max_value=2520, value=252, key="projection_horizon")
+    seed = seed_col.number_input("Random Seed", min_value=0, value=42, key="projection_seed")
+
+    summaries = {}
+    columns = st.columns(2)
+    for column, (name, portfolio_weights) in zip(columns, [("Selected Portfolio", context.weights), ("Optimized Portfolio", context.optimized_weights)]):
+        fan, summary, _ = simulate_portfolio_paths(
+            portfolio_weights, context.returns, horizon, num_paths,
+            'bootstrap' if method == 'Historical Bootstrap' else 'normal', seed
+        )
+        summaries[name] = summary
+        column.plotly_chart(plot_projection_fan(fan, f'{name}: {num_paths:,} Simulated Paths'))
+
+    # VaR / CVaR are losses as a fraction of the initial investment over the horizon
+    st.write(pd.DataFrame(summaries).T.style.format("{:.2%}"))
+
 ##################################################################################
 #                                                                                #
 # Application UI                                                                 #
@@ -384,73 +351,219 @@ tickers = []
 weights = []
 sub_portfolio_percentage = 0.25
 
+data_source = st.radio("Select Price Data Source", ('Yahoo Finance', 'Local Files'))
+if data_source == 'Local Files':
+    data_provider = LocalFileProvider(st.text_input("Price file or directory (CSV/Parquet)", value="data"))
+else:
+    price_cache.offline = st.checkbox("Offline mode (use cached prices only)", value=False)
+    data_provider = price_cache
+
+# Covariance backend; shrinkage and factor models keep large ticker universes well conditioned and fast
+covariance_options = {
+    "Sample": "sample",
+    "Ledoit-Wolf Shrinkage": "ledoit_wolf",
+    "Factor Model (PCA)": "pca",
+    "Factor Model (Market)": "market"
+}
+covariance_model = st.selectbox("Select Covariance Model", list(covariance_options))
+num_factors = 5
+if covariance_model == "Factor Model (PCA)":
+    num_factors = st.slider("Number of PCA Factors", min_value=1, max_value=20, value=5)
+
+optimization_method = st.radio("Select Optimization Method", ('Exact Optimizer', 'Monte Carlo Sampling'))
+show_monte_carlo = optimization_method == 'Monte Carlo Sampling' or st.checkbox("Overlay Monte Carlo portfolios", value=False)
+
+color_by = st.selectbox("Colour Monte Carlo Portfolios By", ('Sharpe Ratio', 'Realized Cumulative Return', 'Max Drawdown', 'Alpha', 'Beta'))
+
+# Optional constraints (per-asset weights, sector caps, number of holdings); the exact optimizer applies the per-asset weights
+sampler = None
+with st.expander("Portfolio Constraints"):
+    min_weight = st.number_input(
+        "Minimum Weight per Asset (%)", min_value=0.0, max_value=100.0, value=0.0,
+        help="With fewer holdings than tickers, the minimum applies only to the assets that are held."
+    )
+    max_weight = st.number_input("Maximum Weight per Asset (%)", min_value=0.0, max_value=100.0, value=100.0)
+    max_holdings = st.number_input("Maximum Number of Holdings", min_value=1, value=max(1, len(tickers)))
+    sector_table = st.data_editor(pd.DataFrame({"Ticker": tickers, "Sector": [""] * len(tickers)}), disabled=["Ticker"], key="sector_table")
+    sector_caps_text = st.text_input("Sector Caps in % (e.g. Tech=40, Energy=20)", value="")
+    try:
+        sector_caps = {
+            name.strip(): float(cap) / 100
+            for name, cap in (item.split('=') for item in sector_caps_text.split(',') if item.strip())
+        }
+        if min_weight > 0 or max_weight < 100 or max_holdings < len(tickers) or sector_caps:
+            sampler = core.ConstrainedSampler(
+                len(tickers), min_weight / 100, max_weight / 100,
+                [sector.strip() or None for sector in sector_table["Sector"]], sector_caps, max_holdings
+            )
+    except ValueError as e:
+        st.error(f"Invalid constraints: {str(e)}")
+
 num_portfolios=5000
 num_portfolios_input_method = st.radio("Select Number of Portfolios for Efficient Frontier", ('Slider', 'Number Input'))
 if num_portfolios_input_method=='Slider': 
     num_portfolios = st.slider("Select Number of Portfolios for Efficient Frontier", min_value=100, max_value=10000, value=5000, step=100)
 else:
     num_portfolios = st.number_input("Number of Portfolios", min_value=100, value=num_portfolios)
+early_stop_chunks = st.number_input("Stop Sampling Early After N Chunks Without a Better Sharpe Ratio (0 = never)", min_value=0, value=0)
+# Multi-core sampling keeps memory flat for millions of portfolios by keeping only the frontier,
+# the best Sharpe ratios and a random sample for the chart
+use_all_cores = st.checkbox("Sample on all CPU cores (keeps the frontier, the top 1,000 Sharpe ratios and a 5,000-portfolio sample)", value=False)
+# Sampled weights live in one contiguous matrix; single precision halves it for very large runs
+weights_dtype = 'float32' if st.checkbox("Store sampled weights in single precision", value=False) else 'float64'
 
-if st.button("Deploy Efficient Frontier"):
-    returns = get_data(tickers, start_date, end_date)
-    if returns is not None:
-        mean_returns = returns.mean()
-        cov_matrix = returns.cov()
-        custom_return, custom_std_dev, custom_sharpe = portfolio_performance(weights, mean_returns, cov_matrix, risk_free_rate)
-        results, weights_record = efficient_frontier(mean_returns, cov_matrix, num_portfolios, risk_free_rate)
-        fig = plot_efficient_frontier(results, weights_record, weights, custom_return, custom_std_dev, tickers)
-        st.plotly_chart(fig)
-        st.subheader("Portfolio Performance Metrics")
-        st.write(f"Expected Annual Return: {custom_return:.3%}")
-        st.write(f"Expected Volatility: {custom_std_dev:.3%}")
-        st.write(f"Sharpe Ratio: {(custom_return - risk_free_rate) / custom_std_dev:.3f}")
-        portfolio_summary_table(results, weights_record, tickers)
-        st.subheader("Optimized & Select Portfolio Backtest")
-        portfolio_backtest(results, weights_record, weights, tickers, start_date, end_date)
-        st.subheader("Optimized & Selected Portfolio Alpha,Beta")
-        display_alpha_beta(results, weights_record, weights, tickers, start_date, end_date, risk_free_rate)
-        st.subheader("Correlation Matrix")
-        display_correlation_matrix(returns, tickers)
-        st.subheader("Predictive Strongest Performers (Mean-Return Analysis)")
-        display_top_performers(mean_returns, tickers)
-        st.subheader("Subportfolio Header")
-        max_sharpe_idx = np.argmax(results[2])
-        optimized_portfolio_weights = weights_record[max_sharpe_idx]
-        df = pd.DataFrame([tickers, optimized_portfolio_weights])
-        # Scale the optimized portfolio weights
-        scaled_weights = optimized_portfolio_weights * sub_portfolio_percentage
-
-        # Create a DataFrame to display the stock tickers and their scaled weights
-        scaled_weights_df = pd.DataFrame({
-            "Ticker": tickers,
-            "Weight (%)": scaled_weights * 100
-        })
-
-        # Display the table in the app
-        st.table(scaled_weights_df)
-
-        # Option to download the scaled weights as CSV
-        csv_scaled = scaled_weights_df.to_csv(index=False)
-        st.download_button(
-            label="Download Sub-portfolio CSV",
-            data=csv_scaled,
-            file_name="sub-portfolio.csv",
-            mime="text/csv"
-        )
+# Per-step wall time, peak memory and fetched rows/bytes for diagnosing slow runs
+show_debug_panel = st.checkbox("Show Performance Debug Panel", value=False)
 
-        # Download CSV for Optimized Portfolio
-        # Create a DataFrame with two rows: one for tickers and one for weights
-        # Convert DataFrame to CSV
-        csv = df.to_csv(index=False, header=False)
-        # Convert the CSV string into a BytesIO object
-        csv_file = io.StringIO(csv)
-        # Add download button for CSV file
-        st.download_button(
-            label="Download Optimized Portfolio CSV",
-            data=csv_file.getvalue(),
-            file_name="optimized-portfolio.csv",
-            mime="text/csv"
-        )
+# Keep the results on screen across widget interactions; memoized steps make these reruns cheap
+if st.button("Deploy Efficient Frontier"):
+    st.session_state.deployed = True
+    st.session_state.pop("frontier_partial", None)
+
+if st.session_state.get("deployed"):
+    # The with block stops tracemalloc even when Streamlit interrupts the run (Stop Sampling, a widget change) or a step raises
+    with Profiler(track_memory=show_debug_panel) as profiler:
+        memo_hits, memo_misses = default_store.hits, default_store.misses
+        # Log provider requests and the actual Yahoo downloads behind them (price_cache is recreated every rerun)
+        price_cache.downloader = profiler.wrap_fetch(price_cache.downloader, 'download')
+        with profiler.stage("Step 1: Fetch data"):
+            context = build_analysis_context(tickers, weights, start_date, end_date, selected_market, risk_free_rate, profiler.instrument(data_provider),
+                                             covariance_options[covariance_model], num_factors)
+        # Tickers whose prices could not be fetched are dropped and the rest of the run uses what remains
+        if context is not None and context.failures:
+            st.warning(f"Continuing without {len(context.failures)} ticker(s) that could not be fetched; the remaining weights were rescaled to 100%.")
+            st.dataframe(pd.DataFrame({"Ticker": list(context.failures), "Reason": list(context.failures.values())}))
+            kept = [tickers.index(ticker) for ticker in context.tickers]
+            tickers, weights = context.tickers, context.weights
+            if sampler is not None:
+                try:
+                    sampler = sampler.subset(kept)
+                except ValueError as e:
+                    st.error(f"Invalid constraints for the remaining tickers: {str(e)}")
+                    context = None
+        if context is not None:
+            mean_returns = context.mean_returns
+            cov_matrix = context.cov_matrix
+            with profiler.stage("Step 2: Portfolio performance"):
+                custom_return, custom_std_dev, custom_sharpe = portfolio_performance(weights, mean_returns, cov_matrix, risk_free_rate)
+            cloud_results, cloud_weights_record = None, None
+            if show_monte_carlo:
+                with profiler.stage("Step 3: Monte Carlo frontier"):
+                    if use_all_cores:
+                        with st.spinner(f"Sampling {num_portfolios:,} portfolios on all CPU cores..."):
+                            cloud_results, cloud_weights_record = sharded_efficient_frontier(
+                                mean_returns, cov_matrix, num_portfolios, risk_free_rate, sampler=sampler, dtype=weights_dtype
+                            )
+                    else:
+                        cloud_results, cloud_weights_record = stream_efficient_frontier(
+                            mean_returns, cov_matrix, num_portfolios, risk_free_rate, sampler, weights_dtype, early_stop_chunks or None,
+                            weights, custom_return, custom_std_dev, tickers
+                        )
+                if sampler is not None and sampler.stats['portfolios']:
+                    sampler_report = sampler.report()
+                    st.caption(
+                        f"Constrained sampler: {sampler_report['Portfolios']:,} portfolios, "
+                        f"{sampler_report['Acceptance Rate']:.1%} holdings acceptance, "
+                        f"{sampler_report['Portfolios per Second']:,.0f} portfolios/s"
+                    )
+            # Realized backtest/CAPM metrics for every sampled portfolio in one pass
+            color_values = None
+            if show_monte_carlo and color_by != 'Sharpe Ratio':
+                with profiler.stage("Step 8b: Realized frontier metrics"):
+                    color_values = frontier_realized_metrics(context.returns, context.market_returns, cloud_weights_record, risk_free_rate)[color_by].to_numpy()
+            frontier = None
+            if optimization_method == 'Exact Optimizer':
+                # The exact optimizer enforces per-asset weight limits; a holdings limit and sector caps need the sampler
+                min_weights, max_weights = 0.0, 1.0
+                if sampler is not None:
+                    semi_continuous = sampler.max_holdings < len(sampler.lower)
+                    min_weights = 0.0 if semi_continuous else sampler.lower
+                    max_weights = sampler.upper
+                    ignored = ["holdings limit and its minimum weight"] * semi_continuous + ["sector caps"] * bool(sampler.sector_caps)
+                    if ignored:
+                        st.warning(f"The exact optimizer ignores the {' and the '.join(ignored)}; use Monte Carlo Sampling to apply them.")
+                with profiler.stage("Step 3b: Exact frontier"):
+                    results, weights_record = exact_frontier(
+                        mean_returns, cov_matrix, risk_free_rate=risk_free_rate, min_weights=min_weights, max_weights=max_weights
+                    )
+                frontier = (results, weights_record)
+            else:
+                results, weights_record = cloud_results, cloud_weights_record
+            with profiler.stage("Step 4: Plot frontier"):
+                fig = plot_efficient_frontier(cloud_results, cloud_weights_record, weights, custom_return, custom_std_dev, tickers, frontier=frontier, color_values=color_values, color_label=color_by, risk_free_rate=risk_free_rate)
+                st.plotly_chart(fig)
+            st.subheader("Portfolio Performance Metrics")
+            st.write(f"Expected Annual Return: {custom_return:.3%}")
+            st.write(f"Expected Volatility: {custom_std_dev:.3%}")
+            st.write(f"Sharpe Ratio: {(custom_return - risk_free_rate) / custom_std_dev:.3f}")
+            context.set_frontier(results, weights_record)
+            with profiler.stage("Step 5: Summary table"):
+                portfolio_summary_table(results, weights_record, tickers)
+            st.subheader("Optimized & Select Portfolio Backtest")
+            with profiler.stage("Step 7: Backtest"):
+                portfolio_backtest(context)
+            st.subheader("Walk-Forward Backtest (Out-of-Sample)")
+            with profiler.stage("Step 7b: Walk-forward backtest"):
+                display_walk_forward(context)
+            st.subheader("Optimized & Selected Portfolio Alpha,Beta")
+            with profiler.stage("Step 9: Alpha and beta"):
+                display_alpha_beta(context)
+            st.subheader("Monte Carlo Projection")
+            with profiler.stage("Step 11: Monte Carlo projection"):
+                display_monte_carlo_projection(context)
+            st.subheader("Correlation Matrix")
+            with profiler.stage("Step 6: Correlation matrix"):
+                display_correlation_matrix(context)
+            st.subheader("Predictive Strongest Performers (Mean-Return Analysis)")
+            with profiler.stage("Step 10: Top performers"):
+                display_top_performers(mean_returns, tickers)
+            st.subheader("Subportfolio Header")
+            optimized_portfolio_weights = context.optimized_weights
+            df = pd.DataFrame([tickers, optimized_portfolio_weights])
+            # Scale the optimized portfolio weights
+            scaled_weights = optimized_portfolio_weights * sub_portfolio_percentage
+
+            # Create a DataFrame to display the stock tickers and their scaled weights
+            scaled_weights_df = pd.DataFrame({
+                "Ticker": tickers,
+                "Weight (%)": scaled_weights * 100
+            })
+
+            # Display the table in the app
+            st.table(scaled_weights_df)
+
+            # Option to download the scaled weights as CSV
+            csv_scaled = scaled_weights_df.to_csv(index=False)
+            st.download_button(
+                label="Download Sub-portfolio CSV",
+                data=csv_scaled,
+                file_name="sub-portfolio.csv",
+                mime="text/csv"
+            )
+
+            # Download CSV for Optimized Portfolio
+            # Create a DataFrame with two rows: one for tickers and one for weights
+            # Convert DataFrame to CSV
+            csv = df.to_csv(index=False, header=False)
+            # Convert the CSV string into a BytesIO object
+            csv_file = io.StringIO(csv)
+            # Add download button for CSV file
+            st.download_button(
+                label="Download Optimized Portfolio CSV",
+                data=csv_file.getvalue(),
+                file_name="optimized-portfolio.csv",
+                mime="text/csv"
+            )
+
+        if show_debug_panel:
+            with st.expander("Performance Debug Panel", expanded=True):
+                st.dataframe(profiler.stage_table().style.format({"seconds": "{:.3f}"}))
+                st.write("Price requests by source (redundant = same symbol and date range requested again)")
+                st.write(pd.DataFrame(profiler.fetch_summary()).T)
+                st.caption(f"Memoized steps this run: {default_store.hits - memo_hits} hits, {default_store.misses - memo_misses} misses")
+                json_col, prometheus_col = st.columns(2)
+                json_col.download_button(label="Download Metrics (JSON)", data=profiler.to_json(), file_name="deploy-metrics.json", mime="application/json")
+                prometheus_col.download_button(label="Download Metrics (Prometheus)", data=profiler.to_prometheus(), file_name="deploy-metrics.prom", mime="text/plain")
 
       
 
@@ -0,0 +1,200 @@
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Input-keyed memoization for the Deploy pipeline. Streamlit re-executes example.py on every
+# widget interaction, but imported modules stay loaded, so the store below survives reruns.
+# Keys are a stable hash of the function name and its arguments (DataFrames and arrays are
+# hashed by content), so a rerun with unchanged inputs is served from memory or disk.
+
+
+def _update_hash(digest, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode())
+        digest.update(repr(value.columns.tolist() if isinstance(value, pd.DataFrame) else value.name).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"ndarray{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(b"dict")
+        for key in sorted(value, key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif hasattr(value, 'memo_key'):
+        # Providers and other objects describe their identity through memo_key()
+        digest.update(type(value).__name__.encode())
+        _update_hash(digest, value.memo_key())
+    else:
+        digest.update(f"{type(value).__name__}:{value!r}".encode())
+
+
+def _nbytes(value):
+    # Approximate memory held by a cached value; memory-mapped arrays live in the page cache, not the heap
+    if isinstance(value, np.memmap):
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=True)))
+    if isinstance(value, dict):
+        return sum(_nbytes(key) + _nbytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(value)
+    try:
+        # Other objects (e.g. Plotly figures) are measured by their pickled size
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def stable_hash(value):
+    """
+    Hash value by content so equal inputs produce the same key across reruns and processes.
+    """
+    digest = hashlib.sha256()
+    _update_hash(digest, value)
+    return digest.hexdigest()
+
+
+class MemoStore:
+    """
+    Bounded LRU store kept in memory, optionally backed by pickle files in disk_dir.
+    The memory tier holds at most max_entries values and max_bytes in total (a single larger value
+    is only kept on disk); the disk tier is trimmed to max_disk_bytes. Both evict the least recently
+    used entries first.
+    """
+
+    def __init__(self, max_entries=32, disk_dir=None, max_disk_bytes=512 * 1024 * 1024, max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.pkl')
+
+    def get(self, key):
+        """
+        Return (True, value) on a hit and (False, None) on a miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    value = pickle.load(f)
+            except Exception:
+                # Unreadable or stale (pickled by an older version of the code): recompute
+                value = None
+            else:
+                os.utime(self._disk_path(key))
+                self._put_memory(key, value)
+                with self._lock:
+                    self.hits += 1
+                return True, value
+
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def _put_memory(self, key, value):
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self.nbytes -= self._entries.popitem(last=False)[1][1]
+
+    def put(self, key, value):
+        self._put_memory(key, value)
+        if self.disk_dir:
+            temp_path = f"{self._disk_path(key)}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self._disk_path(key))
+            except (OSError, pickle.PicklingError, TypeError, AttributeError):
+                return
+            self._evict_disk()
+
+    def _evict_disk(self):
+        files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith('.pkl')]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+# Shared store for the app; set PORTFOLIO_MEMO_DIR to also persist results on disk
+default_store = MemoStore(disk_dir=os.environ.get("PORTFOLIO_MEMO_DIR"))
+
+
+def memoize(store=None, name=None, cache_if=None):
+    """
+    Decorator caching a function's result under a stable hash of its name and arguments.
+    None results are never cached so failed fetches are retried on the next call; cache_if(value)
+    returning False likewise skips caching (e.g. for partially failed downloads).
+    The wrapper also has lookup(*args, **kwargs) -> (hit, value) and remember(value, *args, **kwargs)
+    for callers that compute the result some other way (e.g. incrementally) under the same key.
+    """
+    def decorator(func):
+        key_name = name or func.__qualname__
+
+        def lookup(*args, **kwargs):
+            return (store or default_store).get(stable_hash((key_name, args, kwargs)))
+
+        def remember(value, *args, **kwargs):
+            if value is not None and (cache_if is None or cache_if(value)):
+                (store or default_store).put(stable_hash((key_name, args, kwargs)), value)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            hit, value = lookup(*args, **kwargs)
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            remember(value, *args, **kwargs)
+            return value
+
+        wrapper.lookup = lookup
+        wrapper.remember = remember
+        return wrapper
+
+    return decorator
@@ -0,0 +1,1057 @@
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Headless compute core for the portfolio analysis tool. Nothing here imports Streamlit or
+# Plotly, and SciPy / yfinance are only imported when an optimizer or a download is used,
+# so the math can be imported quickly by example.py (the web UI), batch.py and notebooks.
+
+# Market indices available for comparison
+market_options = {
+    "S&P 500": "^GSPC",
+    "DJIA": "^DJI",
+    "Russell 1000": "^RUI",
+    "NASDAQ": "^IXIC"
+}
+
+# Step 1: Fetch historical stock prices (errors propagate to the caller)
+def get_data(tickers, start_date, end_date, provider=None):
+    # Symbols the provider could not fetch are missing from the columns and listed in attrs['failures']
+    if provider is None:
+        from price_cache import PriceCache
+        provider = PriceCache()
+    data = provider.get_closes(tickers, start_date, end_date)
+    returns = data.pct_change().dropna()
+    returns.attrs['failures'] = dict(data.attrs.get('failures', {}))
+    return returns
+
+# Step 1b: Analysis context shared by every step of a Deploy run
+class AnalysisContext:
+    """
+    Data for one Deploy run, fetched and derived once and read by every step.
+    Holds the asset and market returns with their mean/cov/corr and, once set_frontier
+    is called, the optimized weights and the daily returns of the selected and optimized portfolios.
+    """
+
+    def __init__(self, returns, market_returns, market_name, weights, risk_free_rate, cov_method='sample', num_factors=5):
+        self.returns = returns
+        self.market_returns = market_returns
+        self.market_name = market_name
+        self.tickers = list(returns.columns)
+        self.weights = np.asarray(weights, dtype=float)
+        self.risk_free_rate = risk_free_rate
+        self.mean_returns = returns.mean()
+        self.cov_matrix = covariance_matrix(returns, cov_method, num_factors, market_returns)
+        self.corr_matrix = returns.corr()
+        self.selected_portfolio_returns = returns @ self.weights
+        self.failures = {}
+        self.results = None
+        self.weights_record = None
+        self.optimized_weights = None
+        self.optimized_portfolio_returns = None
+
+    def set_frontier(self, results, weights_record):
+        self.results = results
+        self.weights_record = weights_record
+        self.optimized_weights = np.asarray(weights_record[np.argmax(results[2])], dtype=float)
+        self.optimized_portfolio_returns = self.returns @ self.optimized_weights
+
+def build_analysis_context(tickers, weights, start_date, end_date, market_name, risk_free_rate, provider=None, fetch=get_data,
+                           cov_method='sample', num_factors=5, allow_partial=False):
+    """
+    Fetch the asset and market index returns and build the AnalysisContext.
+    They are fetched separately so changing only the market index reuses memoized asset returns
+    when `fetch` is a memoized get_data. Raises ValueError when a symbol has no price data, unless
+    allow_partial is set: then tickers without data are dropped, the remaining weights are rescaled
+    to sum to one and the dropped tickers are reported in context.failures (symbol -> reason).
+    The market index and at least one ticker are always required.
+    """
+    market_symbol = market_options[market_name]
+    returns = fetch(list(tickers), start_date, end_date, provider)
+    market_data = fetch([market_symbol], start_date, end_date, provider)
+    reasons = {**returns.attrs.get('failures', {}), **market_data.attrs.get('failures', {})}
+
+    missing = [symbol for symbol in tickers if symbol not in returns.columns]
+    fatal = [market_symbol] if market_symbol not in market_data.columns else []
+    if missing and (not allow_partial or len(missing) == len(tickers)):
+        fatal = missing + fatal
+    if fatal:
+        raise ValueError("No price data available for: " + ', '.join(f"{symbol} ({reasons.get(symbol, 'no price data')})" for symbol in fatal))
+
+    weights = np.asarray(weights, dtype=float)
+    available = [i for i, symbol in enumerate(tickers) if symbol in returns.columns]
+    if missing:
+        weights = weights[available] / weights[available].sum()
+    context = AnalysisContext(returns[[tickers[i] for i in available]], market_data[market_symbol], market_name, weights, risk_free_rate,
+                              cov_method, num_factors)
+    context.failures = {symbol: reasons.get(symbol, 'no price data') for symbol in missing}
+    return context
+
+# Step 1c: Covariance backends (sample, Ledoit-Wolf shrinkage, low-rank factor model)
+class FactorCovariance:
+    """
+    Low-rank covariance B F B' + diag(D) with N x k loadings B, k x k factor covariance F and
+    idiosyncratic variances D. It is never expanded to N x N: a portfolio variance costs O(N * k)
+    and storage is N * k instead of N^2.
+    """
+
+    def __init__(self, loadings, factor_cov, specific_var, index=None):
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.factor_cov = np.asarray(factor_cov, dtype=float)
+        self.specific_var = np.asarray(specific_var, dtype=float)
+        self.index = index
+
+    def memo_key(self):
+        return (self.loadings, self.factor_cov, self.specific_var)
+
+    def dot(self, weights):
+        return self.loadings @ (self.factor_cov @ (self.loadings.T @ weights)) + self.specific_var * weights
+
+    def portfolio_variances(self, weights):
+        exposures = weights @ self.loadings
+        return ((exposures @ self.factor_cov) * exposures).sum(axis=-1) + (weights ** 2) @ self.specific_var
+
+    def block(self, rows, cols):
+        # Cov[rows][:, cols] without forming the full matrix
+        block = self.loadings[rows] @ self.factor_cov @ self.loadings[cols].T
+        return block + (np.asarray(rows)[:, None] == np.asarray(cols)[None, :]) * self.specific_var[rows][:, None]
+
+    def diagonal(self):
+        return ((self.loadings @ self.factor_cov) * self.loadings).sum(axis=1) + self.specific_var
+
+    def to_dense(self):
+        dense = self.loadings @ self.factor_cov @ self.loadings.T + np.diag(self.specific_var)
+        return pd.DataFrame(dense, index=self.index, columns=self.index)
+
+def ledoit_wolf_covariance(returns):
+    """
+    Ledoit-Wolf shrinkage of the sample covariance toward a scaled identity, with the shrinkage
+    intensity estimated in closed form. Keeps the matrix well conditioned when N is close to T.
+    """
+    X = returns.to_numpy(dtype=float)
+    X = X - X.mean(axis=0)
+    num_days, num_assets = X.shape
+    sample = X.T @ X / num_days
+    scale = np.trace(sample) / num_assets
+    dispersion = (np.sum(sample ** 2) - 2 * scale * np.trace(sample) + num_assets * scale ** 2) / num_assets
+    # Average squared distance between each day's outer product and the sample covariance
+    noise = (np.sum(np.sum(X ** 2, axis=1) ** 2) / num_days - np.sum(sample ** 2)) / (num_days * num_assets)
+    shrinkage = min(noise, dispersion) / dispersion if dispersion > 0 else 1.0
+    shrunk = shrinkage * scale * np.eye(num_assets) + (1 - shrinkage) * sample
+    return pd.DataFrame(shrunk, index=returns.columns, columns=returns.columns)
+
+def factor_model_covariance(returns, num_factors=5, market_returns=None):
+    """
+    Fit a factor model to daily returns. With market_returns the single factor is the market
+    (loadings are CAPM betas); otherwise the factors are the top num_factors principal components.
+    """
+    X = returns.to_numpy(dtype=float)
+    X = X - X.mean(axis=0)
+    if market_returns is not None:
+        market = market_returns.reindex(returns.index).fillna(0).to_numpy(dtype=float)
+        factors = (market - market.mean())[:, None]
+        loadings = (X.T @ factors) / (factors[:, 0] @ factors[:, 0])
+    else:
+        num_factors = min(num_factors, *X.shape)
+        _, _, components = np.linalg.svd(X, full_matrices=False)
+        loadings = components[:num_factors].T
+        factors = X @ loadings
+
+    residuals = X - factors @ loadings.T
+    factor_cov = np.atleast_2d(np.cov(factors, rowvar=False))
+    specific_var = residuals.var(axis=0, ddof=1)
+    return FactorCovariance(loadings, factor_cov, specific_var, returns.columns)
+
+def covariance_matrix(returns, method='sample', num_factors=5, market_returns=None):
+    if method == 'ledoit_wolf':
+        return ledoit_wolf_covariance(returns)
+    if method == 'pca':
+        return factor_model_covariance(returns, num_factors)
+    if method == 'market':
+        return factor_model_covariance(returns, market_returns=market_returns)
+    return returns.cov()
+
+def portfolio_variances(weights, cov_matrix):
+    """
+    Daily variance w' Cov w for a weight vector, or for every row of a weight matrix.
+    """
+    if isinstance(cov_matrix, FactorCovariance):
+        return cov_matrix.portfolio_variances(weights)
+    return ((weights @ np.asarray(cov_matrix)) * weights).sum(axis=-1)
+
+def _cov_dot(cov_matrix):
+    if isinstance(cov_matrix, FactorCovariance):
+        return cov_matrix.dot
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    return lambda weights: cov_matrix @ weights
+
+def _cov_block(cov_matrix):
+    if isinstance(cov_matrix, FactorCovariance):
+        return cov_matrix.block
+    cov_matrix = np.asarray(cov_matrix, dtype=float)
+    return lambda rows, cols: cov_matrix[np.ix_(rows, cols)]
+
+def _cov_diagonal(cov_matrix):
+    if isinstance(cov_matrix, FactorCovariance):
+        return cov_matrix.diagonal()
+    return np.diag(np.asarray(cov_matrix, dtype=float)).copy()
+
+# Step 2: Portfolio performance calculations with adjustable risk-free rate
+def portfolio_performance(weights, mean_returns, cov_matrix, risk_free_rate):
+    # Annualize returns and volatility
+    annualized_return = np.sum(mean_returns * weights) * 252  # Annualizing daily returns
+    annualized_std_dev = np.sqrt(portfolio_variances(np.asarray(weights, dtype=float), cov_matrix)) * np.sqrt(252)  # Annualizing volatility
+    sharpe_ratio = (annualized_return - risk_free_rate) / annualized_std_dev
+    return annualized_return, annualized_std_dev, sharpe_ratio
+
+# Step 3: Compute Efficient Frontier
+def _frontier_arrays(num_portfolios, num_assets, dtype=np.float64, mmap_dir=None):
+    # One contiguous (portfolios x assets) weights matrix next to the 3 x portfolios metrics array,
+    # optionally as .npy memory maps so runs larger than RAM are paged to disk
+    if mmap_dir is None:
+        return np.zeros((3, num_portfolios)), np.empty((num_portfolios, num_assets), dtype=dtype)
+    os.makedirs(mmap_dir, exist_ok=True)
+    results = np.lib.format.open_memmap(os.path.join(mmap_dir, 'frontier-results.npy'), mode='w+', dtype=np.float64, shape=(3, num_portfolios))
+    weights = np.lib.format.open_memmap(os.path.join(mmap_dir, 'frontier-weights.npy'), mode='w+', dtype=dtype, shape=(num_portfolios, num_assets))
+    return results, weights
+
+def load_frontier(mmap_dir):
+    """
+    Reopen the (results, weights_record) written by efficient_frontier(..., mmap_dir=...) as read-only memory maps.
+    """
+    return (np.load(os.path.join(mmap_dir, 'frontier-results.npy'), mmap_mode='r'),
+            np.load(os.path.join(mmap_dir, 'frontier-weights.npy'), mmap_mode='r'))
+
+def _draw_weights(num_rows, num_assets, sampler=None, rng=None):
+    # Long-only weights from the sampler, or uniform draws normalized to one (np.random unless rng is given)
+    if sampler is not None:
+        return sampler.sample(num_rows)
+    weights = (rng or np.random).random((num_rows, num_assets))
+    return weights / weights.sum(axis=1, keepdims=True)
+
+def _score_weights(weights, mean_returns, cov_matrix, risk_free_rate):
+    # Annualized return, volatility (w' * Cov * w for every row) and Sharpe ratio
+    returns = weights @ mean_returns * 252
+    std_dev = np.sqrt(portfolio_variances(weights, cov_matrix)) * np.sqrt(252)
+    return std_dev, returns, (returns - risk_free_rate) / std_dev
+
+def iter_efficient_frontier(mean_returns, cov_matrix, num_portfolios=100, risk_free_rate=0.01, chunk_size=2048, sampler=None,
+                            dtype=np.float64, mmap_dir=None, patience=None, min_improvement=0.0):
+    """
+    Generator behind efficient_frontier that yields after every chunk, so callers can show partial
+    results while sampling continues and cancel by simply not asking for the next chunk.
+    Each step yields (results, weights_record, stats): views of the portfolios filled so far (no copy)
+    and a stats dict with the progress, the best Sharpe ratio and minimum volatility so far with their
+    indices, and the number of chunks since the best Sharpe ratio last improved by more than
+    min_improvement. With `patience`, sampling stops once that count reaches patience
+    (stats['stopped_early'] is then True on the last step).
+    """
+    mean_returns = np.asarray(mean_returns, dtype=float)
+    if not isinstance(cov_matrix, FactorCovariance):
+        cov_matrix = np.asarray(cov_matrix, dtype=float)
+    num_assets = len(mean_returns)
+    results, weights_record = _frontier_arrays(num_portfolios, num_assets, dtype, mmap_dir)
+    stats = {'done': 0, 'total': num_portfolios, 'best_sharpe': -np.inf, 'best_index': None,
+             'min_volatility': np.inf, 'min_volatility_index': None, 'stale_chunks': 0, 'stopped_early': False}
+
+    try:
+        for start in range(0, num_portfolios, chunk_size):
+            stop = min(start + chunk_size, num_portfolios)
+            weights = _draw_weights(stop - start, num_assets, sampler)
+            std_dev, returns, sharpe_ratios = _score_weights(weights, mean_returns, cov_matrix, risk_free_rate)
+            results[0, start:stop] = std_dev
+            results[1, start:stop] = returns
+            results[2, start:stop] = sharpe_ratios
+            weights_record[start:stop] = weights
+
+            # Running optima only need the new chunk
+            chunk_best = start + int(np.argmax(results[2, start:stop]))
+            chunk_min_volatility = start + int(np.argmin(std_dev))
+            if results[2, chunk_best] > stats['best_sharpe'] + min_improvement:
+                stats['stale_chunks'] = 0
+            else:
+                stats['stale_chunks'] += 1
+            if results[2, chunk_best] > stats['best_sharpe']:
+                stats['best_sharpe'], stats['best_index'] = float(results[2, chunk_best]), chunk_best
+            if std_dev.min() < stats['min_volatility']:
+                stats['min_volatility'], stats['min_volatility_index'] = float(std_dev.min()), chunk_min_volatility
+            stats['done'] = stop
+            stats['stopped_early'] = patience is not None and stats['stale_chunks'] >= patience and stop < num_portfolios
+
+            yield results[:, :stop], weights_record[:stop], stats
+            if stats['stopped_early']:
+                break
+    finally:
+        if mmap_dir is not None:
+            results.flush()
+            weights_record.flush()
+
+def efficient_frontier(mean_returns, cov_matrix, num_portfolios=100, risk_free_rate=0.01, chunk_size=2048, sampler=None,
+                       dtype=np.float64, mmap_dir=None, patience=None, min_improvement=0.0):
+    """
+    Sample random long-only portfolios and score them in fixed-size chunks.
+    Each chunk draws its whole weight matrix at once and computes returns, volatilities
+    and Sharpe ratios with matrix ops, so memory stays bounded by chunk_size.
+    Pass a ConstrainedSampler to draw only portfolios that satisfy weight, sector and holding limits.
+
+    weights_record is a single (num_portfolios, num_assets) array; dtype=np.float32 halves its size
+    (metrics are still computed in float64). With mmap_dir both arrays are written to .npy memory
+    maps in that directory (overwriting a previous run there); see load_frontier.
+    With patience, sampling stops early (and fewer portfolios are returned) once the best Sharpe ratio
+    has not improved for that many chunks; see iter_efficient_frontier.
+    """
+    results, weights_record = np.zeros((3, 0)), np.empty((0, len(mean_returns)), dtype=dtype)
+    for results, weights_record, _ in iter_efficient_frontier(mean_returns, cov_matrix, num_portfolios, risk_free_rate, chunk_size,
+                                                              sampler, dtype, mmap_dir, patience, min_improvement):
+        pass
+    return results, weights_record
+
+# Step 3d: Multi-core sharded sampling with an online Pareto / top-K reduction
+def _pareto_indices(results):
+    # Portfolios no other portfolio beats on both volatility (lower) and return (higher)
+    order = np.lexsort((-results[1], results[0]))
+    returns = results[1, order]
+    best_so_far = np.maximum.accumulate(np.concatenate([[-np.inf], returns[:-1]]))
+    return order[returns > best_so_far]
+
+def _reduce_frontier(results, weights, keys, top_k, sample_size):
+    # Keep the non-dominated set, the top_k Sharpe ratios and the sample_size smallest random keys
+    # (a uniform sample); each part of the union of two reductions reduces to that of the whole
+    num_portfolios = results.shape[1]
+    keep = np.zeros(num_portfolios, dtype=bool)
+    keep[_pareto_indices(results)] = True
+    for values, count in ((-results[2], top_k), (keys, sample_size)):
+        if count >= num_portfolios:
+            keep[:] = True
+        elif count > 0:
+            keep[np.argpartition(values, count - 1)[:count]] = True
+    kept = np.flatnonzero(keep)
+    return results[:, kept], weights[kept], keys[kept]
+
+# Inputs shared by every shard are sent to each worker once at start-up rather than with every shard
+_shard_inputs = None
+
+def _init_shard_worker(inputs):
+    global _shard_inputs
+    _shard_inputs = inputs
+
+def _frontier_shard(args):
+    num_portfolios, seed_sequence = args
+    mean_returns, cov_matrix, risk_free_rate, chunk_size, sampler, dtype, top_k, sample_size = _shard_inputs
+    rng = np.random.default_rng(seed_sequence)
+    if sampler is not None:
+        sampler.rng = rng  # Each worker holds its own copy of the sampler
+        stats_before = dict(sampler.stats)
+    num_assets = len(mean_returns)
+    # Chunks are buffered and reduced together once they outnumber the kept portfolios a few times over,
+    # so the kept set isn't re-sorted after every chunk
+    reduce_every = max(chunk_size, 4 * (top_k + sample_size))
+    pending = [(np.empty((3, 0)), np.empty((0, num_assets), dtype=dtype), np.empty(0))]
+    pending_rows = 0
+    for start in range(0, num_portfolios, chunk_size):
+        chunk = _draw_weights(min(chunk_size, num_portfolios - start), num_assets, sampler, rng)
+        pending.append((np.vstack(_score_weights(chunk, mean_returns, cov_matrix, risk_free_rate)), chunk.astype(dtype), rng.random(len(chunk))))
+        pending_rows += len(chunk)
+        if pending_rows >= reduce_every or start + chunk_size >= num_portfolios:
+            pending = [_reduce_frontier(np.hstack([part[0] for part in pending]), np.vstack([part[1] for part in pending]),
+                                        np.concatenate([part[2] for part in pending]), top_k, sample_size)]
+            pending_rows = 0
+    # The copy's stats never reach the caller, so report what this shard added to them
+    stats = None if sampler is None else {key: sampler.stats[key] - stats_before[key] for key in sampler.stats}
+    return pending[0] + (stats,)
+
+def sharded_efficient_frontier(mean_returns, cov_matrix, num_portfolios=100, risk_free_rate=0.01, workers=None, seed=None,
+                               top_k=1000, sample_size=5000, chunk_size=2048, shards=64, sampler=None, dtype=np.float64):
+    """
+    Sample num_portfolios portfolios across worker processes without keeping them all.
+    The work is split into `shards`, each drawing from its own SeedSequence-spawned generator, so a
+    given seed gives the same result for any number of workers. Each shard keeps only its
+    non-dominated (volatility, return) portfolios, its top_k Sharpe ratios and a uniform sample of
+    sample_size portfolios (for the cloud's shape), and the shards are reduced the same way at the end,
+    so memory stays constant in num_portfolios. Returns the (results, weights_record) contract of
+    efficient_frontier for the kept portfolios, sorted by volatility. A sampler's stats are updated
+    with the totals over all shards.
+    """
+    mean_returns = np.asarray(mean_returns, dtype=float)
+    if not isinstance(cov_matrix, FactorCovariance):
+        cov_matrix = np.asarray(cov_matrix, dtype=float)
+    shards = max(1, min(shards, -(-num_portfolios // chunk_size)))
+    counts = np.diff(np.linspace(0, num_portfolios, shards + 1).astype(int))
+    tasks = list(zip(counts.tolist(), np.random.SeedSequence(seed).spawn(shards)))
+    inputs = (mean_returns, cov_matrix, risk_free_rate, chunk_size, sampler, dtype, top_k, sample_size)
+
+    workers = min(workers or os.cpu_count() or 1, shards)
+    if workers == 1:
+        # In-process: give the shards a copy of the sampler so its generator and stats are not replaced
+        shard_sampler = copy.copy(sampler)
+        if shard_sampler is not None:
+            shard_sampler.stats = dict(sampler.stats)
+        _init_shard_worker(inputs[:4] + (shard_sampler,) + inputs[5:])
+        try:
+            outputs = [_frontier_shard(task) for task in tasks]
+        finally:
+            _init_shard_worker(None)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker, initargs=(inputs,)) as pool:
+            outputs = list(pool.map(_frontier_shard, tasks))
+    if sampler is not None:
+        for output in outputs:
+            for key, value in output[3].items():
+                sampler.stats[key] += value
+
+    results, weights_record, _ = _reduce_frontier(
+        np.hstack([output[0] for output in outputs]), np.vstack([output[1] for output in outputs]),
+        np.concatenate([output[2] for output in outputs]), top_k, sample_size
+    )
+    order = np.argsort(results[0], kind='stable')
+    return results[:, order], weights_record[order]
+
+# Step 3c: Constraint-aware weight sampling (box, sector and cardinality limits)
+def _project_capped_simplex(x, lower, upper, total, iterations=60):
+    # Row-wise Euclidean projection onto {lower <= w <= upper, sum(w) = total} by bisection on the shift
+    tau_low = (x - upper).min(axis=1) - 1
+    tau_high = (x - lower).max(axis=1) + 1
+    for _ in range(iterations):
+        tau = (tau_low + tau_high) / 2
+        too_big = np.clip(x - tau[:, None], lower, upper).sum(axis=1) > total
+        tau_low = np.where(too_big, tau, tau_low)
+        tau_high = np.where(too_big, tau_high, tau)
+    return np.clip(x - ((tau_low + tau_high) / 2)[:, None], lower, upper)
+
+class ConstrainedSampler:
+    """
+    Draw long-only weight vectors that satisfy per-asset min/max weights, sector caps and a maximum
+    number of holdings without rejection sampling. Each row picks its holdings, draws sector totals
+    and within-sector weights from a flat Dirichlet and projects them onto the capped simplex, so every
+    portfolio costs the same regardless of how tight the limits are. Only a holdings selection whose
+    sector caps cannot add up to 100% (or cannot fit its held minimums) is redrawn; `stats` reports
+    how often that happened.
+
+    When `max_holdings` is below the number of assets the minimum weights are semi-continuous: an
+    asset is either left out or held at no less than its minimum, so a minimum does not force it in.
+    """
+
+    def __init__(self, num_assets, min_weights=0.0, max_weights=1.0, sectors=None, sector_caps=None, max_holdings=None, seed=None):
+        self.lower = np.broadcast_to(np.asarray(min_weights, dtype=float), (num_assets,)).copy()
+        self.upper = np.broadcast_to(np.asarray(max_weights, dtype=float), (num_assets,)).copy()
+        self.sectors = list(sectors) if sectors is not None else [None] * num_assets
+        self.sector_caps = dict(sector_caps or {})
+        self.max_holdings = num_assets if max_holdings is None else int(max_holdings)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+        # Assets without a sector share one uncapped group
+        self.groups = sorted({sector for sector in self.sectors}, key=str)
+        self.group_of = np.array([self.groups.index(sector) for sector in self.sectors])
+        self.group_caps = np.array([self.sector_caps.get(sector, 1.0) if sector is not None else 1.0 for sector in self.groups])
+
+        # Minimums only bind on held assets: the largest ones any selection could hold must fit in
+        # 100%, and each sector must fit the smallest minimums of the assets every selection holds
+        if np.any(self.lower > self.upper):
+            raise ValueError("Minimum weight is above maximum weight for some assets")
+        if np.sort(self.lower)[::-1][:self.max_holdings].sum() > 1 + 1e-12:
+            raise ValueError("Minimum weights of the held assets add up to more than 100%")
+        if self._capacity(np.ones((1, num_assets), dtype=bool))[0] < 1 - 1e-12:
+            raise ValueError("Maximum weights and sector caps cannot add up to 100%")
+        for group, cap in enumerate(self.group_caps):
+            members = self.group_of == group
+            always_held = max(0, self.max_holdings - (num_assets - members.sum()))
+            if np.sort(self.lower[members])[:always_held].sum() > cap + 1e-12:
+                raise ValueError(f"Minimum weights in sector {self.groups[group]} exceed its cap")
+
+        self.stats = {'portfolios': 0, 'selection_redraws': 0, 'seconds': 0.0}
+
+    def memo_key(self):
+        return (self.lower, self.upper, self.sectors, self.sector_caps, self.max_holdings, self.seed)
+
+    def subset(self, indices):
+        """
+        Sampler with the same limits over only the assets at `indices` (e.g. after tickers without
+        price data were dropped). Raises ValueError if the limits can no longer be met.
+        """
+        indices = list(indices)
+        return ConstrainedSampler(
+            len(indices), self.lower[indices], self.upper[indices], [self.sectors[i] for i in indices],
+            self.sector_caps, min(self.max_holdings, len(indices)), self.seed
+        )
+
+    def _group_bounds(self, mask):
+        lower = np.where(mask, self.lower, 0)
+        upper = np.where(mask, self.upper, 0)
+        group_lower = np.stack([lower[:, self.group_of == g].sum(axis=1) for g in range(len(self.groups))], axis=1)
+        group_upper = np.stack([upper[:, self.group_of == g].sum(axis=1) for g in range(len(self.groups))], axis=1)
+        return lower, upper, group_lower, np.minimum(group_upper, self.group_caps)
+
+    def _capacity(self, mask):
+        return self._group_bounds(mask)[3].sum(axis=1)
+
+    def _infeasible(self, mask):
+        _, _, group_lower, group_upper = self._group_bounds(mask)
+        return (group_upper.sum(axis=1) < 1 - 1e-12) | np.any(group_lower > group_upper + 1e-12, axis=1)
+
+    def _select_holdings(self, num_rows):
+        num_assets = len(self.lower)
+        if self.max_holdings >= num_assets:
+            return np.ones((num_rows, num_assets), dtype=bool)
+        keys = self.rng.random((num_rows, num_assets))
+        chosen = np.argpartition(-keys, self.max_holdings - 1, axis=1)[:, :self.max_holdings]
+        mask = np.zeros((num_rows, num_assets), dtype=bool)
+        np.put_along_axis(mask, chosen, True, axis=1)
+        return mask
+
+    def sample(self, num_rows):
+        started = time.perf_counter()
+        mask = self._select_holdings(num_rows)
+        for _ in range(100):
+            infeasible = self._infeasible(mask)
+            if not infeasible.any():
+                break
+            self.stats['selection_redraws'] += int(infeasible.sum())
+            mask[infeasible] = self._select_holdings(int(infeasible.sum()))
+        else:
+            raise ValueError("Could not find holdings that satisfy the sector caps; loosen the constraints")
+
+        lower, upper, group_lower, group_upper = self._group_bounds(mask)
+
+        # Sector totals, then weights within each sector, each a flat Dirichlet projected onto its bounds
+        group_draws = self.rng.exponential(size=group_upper.shape) * (group_upper > 0)
+        group_totals = _project_capped_simplex(group_draws / group_draws.sum(axis=1, keepdims=True), group_lower, group_upper, 1.0)
+        weights = np.zeros_like(lower)
+        asset_draws = self.rng.exponential(size=lower.shape) * mask
+        for group in range(len(self.groups)):
+            columns = self.group_of == group
+            draws = asset_draws[:, columns]
+            draw_totals = draws.sum(axis=1, keepdims=True)
+            shares = np.divide(draws, draw_totals, out=np.zeros_like(draws), where=draw_totals > 0)
+            weights[:, columns] = _project_capped_simplex(
+                shares * group_totals[:, [group]], lower[:, columns], upper[:, columns], group_totals[:, group]
+            )
+
+        self.stats['portfolios'] += num_rows
+        self.stats['seconds'] += time.perf_counter() - started
+        return weights
+
+    def report(self):
+        drawn = self.stats['portfolios'] + self.stats['selection_redraws']
+        return {
+            'Portfolios': self.stats['portfolios'],
+            'Acceptance Rate': self.stats['portfolios'] / drawn if drawn else 1.0,
+            'Portfolios per Second': self.stats['portfolios'] / self.stats['seconds'] if self.stats['seconds'] else float('nan')
+        }
+
+# Step 3b: Exact long-only optimizer for the tangency, minimum-variance and frontier portfolios
+def _min_variance_weights(cov_matrix, constraints, initial_weights, bounds=None):
+    from scipy.optimize import minimize
+
+    num_assets = len(initial_weights)
+    cov_dot = _cov_dot(cov_matrix)
+    result = minimize(
+        lambda w: w @ cov_dot(w),
+        initial_weights,
+        jac=lambda w: 2 * cov_dot(w),
+        method='SLSQP',
+        bounds=bounds or [(0.0, 1.0)] * num_assets,
+        constraints=constraints,
+        options={'ftol': 1e-12, 'maxiter': 500}
+    )
+    if not result.success:
+        raise ValueError(f"Minimum-variance optimization failed: {result.message}")
+    return result.x
+
+def _max_sharpe_weights(excess_returns, cov_matrix, initial_weights, bounds=None):
+    # Direct long-only max Sharpe over w with sum(w) = 1 (non-convex, used when the QP does not apply)
+    from scipy.optimize import minimize
+
+    num_assets = len(excess_returns)
+    cov_dot = _cov_dot(cov_matrix)
+    result = minimize(
+        lambda w: -(w @ excess_returns) / np.sqrt(w @ cov_dot(w)),
+        initial_weights,
+        method='SLSQP',
+        bounds=bounds or [(0.0, 1.0)] * num_assets,
+        constraints=[{'type': 'eq', 'fun': lambda w: np.sum(w) - 1}],
+        options={'ftol': 1e-12, 'maxiter': 500}
+    )
+    if not result.success:
+        raise ValueError(f"Maximum-Sharpe optimization failed: {result.message}")
+    return result.x
+
+def _max_return_weights(mean_returns, lower, upper):
+    # Highest-return weights within the box: every minimum, then the rest to the best assets in turn
+    weights = lower.copy()
+    for i in np.argsort(-mean_returns, kind='stable'):
+        weights[i] += min(upper[i] - lower[i], 1 - weights.sum())
+    return weights
+
+def _tangency_weights(mean_returns, cov_matrix, risk_free_rate, initial_weights, bounds=None):
+    excess_returns = mean_returns - risk_free_rate / 252
+    num_assets = len(mean_returns)
+    lower, upper = np.array(bounds or [(0.0, 1.0)] * num_assets, dtype=float).T
+    if _max_return_weights(excess_returns, lower, upper) @ excess_returns > 0:
+        # Long-only max Sharpe as a convex QP over the scaled vector y = w / (excess'w):
+        # min y'Cov y s.t. excess'y = 1, y >= 0, then w = y / sum(y). y is unbounded above since
+        # with daily excess returns excess'y = 1 needs entries far larger than one. Weight limits
+        # lower <= w <= upper become lower * sum(y) <= y <= upper * sum(y).
+        constraints = [{'type': 'eq', 'fun': lambda y: excess_returns @ y - 1, 'jac': lambda y: excess_returns}]
+        if bounds is not None:
+            identity = np.eye(num_assets)
+            constraints += [
+                {'type': 'ineq', 'fun': lambda y: y - lower * y.sum(), 'jac': lambda y: identity - lower[:, None]},
+                {'type': 'ineq', 'fun': lambda y: upper * y.sum() - y, 'jac': lambda y: upper[:, None] - identity}
+            ]
+        if initial_weights @ excess_returns > 0:
+            start = initial_weights / (initial_weights @ excess_returns)
+        else:
+            start = np.clip(excess_returns, 0, None) / np.sum(np.clip(excess_returns, 0, None) ** 2)
+        try:
+            y = _min_variance_weights(cov_matrix, constraints, start, bounds=[(0.0, None)] * num_assets)
+        except ValueError:
+            pass  # Fall back to the direct solve below
+        else:
+            y = np.clip(y, 0, None)
+            return np.clip(y / y.sum(), lower, upper)
+
+    # No portfolio beats the risk-free rate (or the QP failed), so maximize the Sharpe ratio directly
+    return _max_sharpe_weights(excess_returns, cov_matrix, initial_weights, bounds)
+
+def _critical_line(mean_returns, cov_matrix, lower, upper):
+    """
+    Turning points of the efficient frontier under sum(w) = 1 and lower <= w <= upper, from the
+    highest-return portfolio down to the minimum-variance one, by Markowitz's critical line algorithm.
+    Between two turning points the frontier weights move along a straight line, so the points describe
+    the whole frontier exactly. Each turn frees or bounds one asset and only solves a linear system over
+    the free assets, instead of a full quadratic program per frontier point. The covariance is only
+    used through products and the rows of the free assets, so a FactorCovariance is never expanded.
+    """
+    num_assets = len(mean_returns)
+    cov_dot, cov_block, cov_diagonal = _cov_dot(cov_matrix), _cov_block(cov_matrix), _cov_diagonal(cov_matrix)
+
+    # Highest-return portfolio: every asset at its minimum, then the best assets filled up in turn;
+    # the asset that takes the last of the budget is the first free one
+    weights = lower.copy()
+    for i in np.argsort(-mean_returns, kind='stable'):
+        weights[i] += min(upper[i] - lower[i], 1 - weights.sum())
+        if weights.sum() >= 1 - 1e-12:
+            free = [i]
+            break
+    turning_points = [weights.copy()]
+    previous_lam = np.inf
+
+    for _ in range(4 * num_assets + 10):
+        free_idx = np.array(free)
+        bound_idx = np.setdiff1d(np.arange(num_assets), free_idx)
+        inv = np.linalg.inv(cov_block(free_idx, free_idx))
+        bounded = np.where(np.isin(np.arange(num_assets), free_idx), 0.0, weights)
+        cov_bounded = cov_dot(bounded)  # Cov @ w_B, the pull of the bounded weights on the free ones
+        inv_ones = inv.sum(axis=1)
+        inv_mean = inv @ mean_returns[free_idx]
+        inv_bounded = inv @ cov_bounded[free_idx]
+        c1, c3, l2 = inv_ones.sum(), inv_mean.sum(), inv_bounded.sum()
+        budget_left = 1 - bounded.sum()
+
+        # a) A free asset reaches its bound at lambda_in
+        lam_in, asset_in, bound_in = -np.inf, None, None
+        if len(free) > 1:
+            c = -c1 * inv_mean + c3 * inv_ones
+            bound = np.where(c > 0, upper[free_idx], lower[free_idx])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lam = ((budget_left + l2) * inv_ones - c1 * (bound + inv_bounded)) / c
+            lam[~np.isfinite(lam) | (lam >= previous_lam)] = -np.inf
+            j = int(np.argmax(lam))
+            lam_in, asset_in, bound_in = lam[j], free[j], bound[j]
+
+        # b) A bounded asset becomes free at lambda_out (the free-set inverse grown by one row/column)
+        lam_out, asset_out = -np.inf, None
+        if len(bound_idx):
+            cross = cov_block(free_idx, bound_idx)
+            cross_inv_cross = (cross * (inv @ cross)).sum(axis=0)
+            s = cov_diagonal[bound_idx] - cross_inv_cross
+            p1, pmu, pz = inv_ones @ cross, inv_mean @ cross, inv_bounded @ cross
+            w_i, mu_i = weights[bound_idx], mean_returns[bound_idx]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                c1_new = c1 + (p1 - 1) ** 2 / s
+                c3_new = c3 + (p1 - 1) * (pmu - mu_i) / s
+                c = -c1_new * (mu_i - pmu) / s + c3_new * (1 - p1) / s
+                v_i = cov_bounded[bound_idx] - cov_diagonal[bound_idx] * w_i
+                u_v = pz - w_i * cross_inv_cross
+                l3_new = (v_i - u_v) / s
+                l2_new = l2 - w_i * p1 + (p1 - 1) * (u_v - v_i) / s
+                lam = ((budget_left + w_i + l2_new) * (1 - p1) / s - c1_new * (w_i + l3_new)) / c
+            lam[~np.isfinite(lam) | (s <= 1e-14 * cov_diagonal[bound_idx]) | (lam >= previous_lam)] = -np.inf
+            j = int(np.argmax(lam))
+            lam_out, asset_out = lam[j], int(bound_idx[j])
+
+        if max(lam_in, lam_out) <= 0:
+            lam = 0.0  # No more turns before the minimum-variance portfolio
+        elif lam_in > lam_out:
+            lam = lam_in
+            free.remove(asset_in)
+            weights[asset_in] = bound_in
+        else:
+            lam = lam_out
+            free.append(asset_out)
+
+        # Free weights at this lambda: minimize w'Cov w / 2 - lambda * mean'w over the free assets
+        free_idx = np.array(free)
+        inv = np.linalg.inv(cov_block(free_idx, free_idx))
+        bounded = np.where(np.isin(np.arange(num_assets), free_idx), 0.0, weights)
+        inv_ones = inv.sum(axis=1)
+        inv_mean = inv @ mean_returns[free_idx]
+        inv_bounded = inv @ cov_dot(bounded)[free_idx]
+        gamma = (-lam * inv_mean.sum() + 1 - bounded.sum() + inv_bounded.sum()) / inv_ones.sum()
+        weights[free_idx] = -inv_bounded + gamma * inv_ones + lam * inv_mean
+        turning_points.append(weights.copy())
+        # An asset just freed or bounded would otherwise turn back at the same lambda up to rounding
+        previous_lam = lam - 1e-12 * abs(lam)
+        if lam == 0:
+            break
+    else:
+        raise ValueError("Critical line algorithm did not reach the minimum-variance portfolio")
+
+    # Drop points that numerical error pushed off the feasible set or below a lower-risk point's return
+    turning_points = np.array(turning_points)
+    feasible = np.all(turning_points >= lower - 1e-9, axis=1) & np.all(turning_points <= upper + 1e-9, axis=1) & \
+        (np.abs(turning_points.sum(axis=1) - 1) < 1e-9)
+    turning_points = turning_points[feasible]
+    point_returns = turning_points @ mean_returns
+    return turning_points[point_returns >= np.minimum.accumulate(point_returns) - 1e-15]
+
+def _segment_max_sharpe(turning_points, excess_returns, cov_dot):
+    # On the segment b + t(a - b) the Sharpe ratio (p + qt) / sqrt(alpha + 2 beta t + gamma t^2) peaks at
+    # t = (p beta - q alpha) / (q beta - p gamma); check that and both ends of every segment
+    best_weights, best_sharpe = None, -np.inf
+    for a, b in zip(turning_points[:-1], turning_points[1:]):
+        d = a - b
+        cov_b, cov_d = cov_dot(b), cov_dot(d)
+        p, q = excess_returns @ b, excess_returns @ d
+        alpha, beta, gamma = b @ cov_b, b @ cov_d, d @ cov_d
+        denominator = q * beta - p * gamma
+        candidates = [0.0, 1.0]
+        if denominator != 0:
+            candidates.append(min(max((p * beta - q * alpha) / denominator, 0.0), 1.0))
+        for t in candidates:
+            sharpe = (p + q * t) / np.sqrt(max(alpha + 2 * beta * t + gamma * t * t, 1e-300))
+            if sharpe > best_sharpe:
+                best_weights, best_sharpe = b + t * d, sharpe
+    return best_weights, best_sharpe
+
+def exact_frontier(mean_returns, cov_matrix, num_points=50, risk_free_rate=0.01, min_weights=0.0, max_weights=1.0):
+    """
+    Solve the long-only minimum-variance portfolio, the tangency (maximum Sharpe) portfolio and
+    the frontier of minimum-variance portfolios for num_points evenly spaced target returns.
+    Per-asset min_weights/max_weights (scalars or arrays, as for ConstrainedSampler) bound every
+    portfolio. The frontier comes from the critical line algorithm's turning points, so the targets
+    are interpolated rather than solved one by one. Returns the same (results, weights_record)
+    contract as efficient_frontier, sorted by return, so argmax/argmin over it pick the exact optima.
+    """
+    mean_returns = np.asarray(mean_returns, dtype=float)
+    if not isinstance(cov_matrix, FactorCovariance):
+        cov_matrix = np.asarray(cov_matrix, dtype=float)
+    num_assets = len(mean_returns)
+    lower = np.broadcast_to(np.asarray(min_weights, dtype=float), (num_assets,)).copy()
+    upper = np.broadcast_to(np.asarray(max_weights, dtype=float), (num_assets,)).copy()
+    if np.any(lower > upper) or lower.sum() > 1 + 1e-12 or upper.sum() < 1 - 1e-12:
+        raise ValueError("Minimum and maximum weights cannot add up to 100%")
+
+    turning_points = _critical_line(mean_returns, cov_matrix, lower, upper)
+    min_var_weights = turning_points[-1]
+    if len(turning_points) > 1:
+        excess_returns = mean_returns - risk_free_rate / 252
+        tangency_weights, tangency_sharpe = _segment_max_sharpe(turning_points, excess_returns, _cov_dot(cov_matrix))
+        if tangency_sharpe <= 0:
+            # No frontier portfolio beats the risk-free rate; the best Sharpe ratio may lie below the frontier
+            tangency_weights = _max_sharpe_weights(excess_returns, cov_matrix, min_var_weights, list(zip(lower, upper)))
+    else:
+        tangency_weights = min_var_weights
+
+    # Frontier portfolios for evenly spaced target returns, interpolated within their segment
+    point_returns = turning_points @ mean_returns
+    targets = np.linspace(point_returns[-1], point_returns[0], num_points)
+    segment = np.clip(np.searchsorted(-point_returns, -targets, side='right'), 1, len(turning_points) - 1)
+    high, low = point_returns[segment - 1], point_returns[segment]
+    t = np.divide(targets - low, high - low, out=np.zeros_like(targets), where=high > low)
+    curve = turning_points[segment] + t[:, None] * (turning_points[segment - 1] - turning_points[segment])
+
+    weights_record = np.clip(np.vstack([min_var_weights, tangency_weights, curve, turning_points]), lower, upper)
+    weights_record /= weights_record.sum(axis=1, keepdims=True)
+    weights_record = weights_record[np.argsort(weights_record @ mean_returns, kind='stable')]
+
+    results = np.zeros((3, len(weights_record)))
+    for i, weights in enumerate(weights_record):
+        returns, std_dev, sharpe_ratio = portfolio_performance(weights, mean_returns, cov_matrix, risk_free_rate)
+        results[0, i] = std_dev
+        results[1, i] = returns
+        results[2, i] = sharpe_ratio
+
+    return results, weights_record
+
+# Step 4 helper: pick the portfolios to plot
+def decimate_frontier(results, max_points=5000, envelope_bins=500, seed=0):
+    """
+    Pick at most max_points portfolio indices to plot: the upper envelope (highest return in each
+    volatility bin), the max-Sharpe and min-variance portfolios, and a uniform random subsample
+    of the rest so the density of the cloud is preserved.
+    """
+    num_portfolios = results.shape[1]
+    if num_portfolios <= max_points:
+        return np.arange(num_portfolios)
+
+    bins = np.digitize(results[0], np.linspace(results[0].min(), results[0].max(), min(envelope_bins, max_points // 2)))
+    order = np.lexsort((-results[1], bins))
+    envelope = order[np.unique(bins[order], return_index=True)[1]]
+    keep = np.unique(np.concatenate([envelope, [np.argmax(results[2]), np.argmin(results[0])]]))
+
+    rest = np.setdiff1d(np.arange(num_portfolios), keep, assume_unique=True)
+    sample_size = max(max_points - len(keep), 0)
+    sample = np.random.default_rng(seed).choice(rest, size=min(sample_size, len(rest)), replace=False)
+    return np.sort(np.concatenate([keep, sample]))
+
+# Step 5: Portfolio Summary Table
+def format_weights(weights, tickers):
+    return ', '.join([f"{tickers[i]}: {weights[i]:.2%}" for i in range(len(weights))])
+
+def build_portfolio_summary(results, weights_record, tickers):
+    max_sharpe_idx = np.argmax(results[2])
+    min_var_idx = np.argmin(results[0])
+
+    summary_data = {
+        'Portfolio': ['Maximum Sharpe Ratio (Optimized Portfolio)', 'Minimum Variance'],
+        'Expected Annual Return': [results[1, max_sharpe_idx], results[1, min_var_idx]],
+        'Expected Volatility': [results[0, max_sharpe_idx], results[0, min_var_idx]],
+        'Sharpe Ratio': [results[2, max_sharpe_idx], results[2, min_var_idx]],
+        'Weights': [format_weights(weights_record[max_sharpe_idx], tickers), format_weights(weights_record[min_var_idx], tickers)]
+    }
+    return pd.DataFrame(summary_data)
+
+# Sharpe Ratio Dataframe
+def filter_portfolios(results, min_return=None, max_volatility=None):
+    mask = np.ones(results.shape[1], dtype=bool)
+    if min_return is not None:
+        mask &= results[1] >= min_return
+    if max_volatility is not None:
+        mask &= results[0] <= max_volatility
+    return np.flatnonzero(mask)
+
+def sharpe_ranked_page(results, weights_record, tickers, candidates, page=0, page_size=50):
+    """
+    Return one page of the candidate portfolios ranked by Sharpe ratio.
+    Partial selection (argpartition) only sorts the portfolios up to the end of the requested page,
+    and weights are only formatted for the rows on that page.
+    """
+    total = len(candidates)
+
+    stop = min((page + 1) * page_size, total)
+    start = min(page * page_size, stop)
+    sharpe = results[2, candidates]
+    top = np.argpartition(-sharpe, stop - 1)[:stop] if 0 < stop < total else np.arange(stop)
+    rows = candidates[top[np.argsort(-sharpe[top], kind='stable')][start:stop]]
+
+    page_df = pd.DataFrame({
+        'Expected Annual Return': results[1, rows],
+        'Expected Volatility': results[0, rows],
+        'Sharpe Ratio': results[2, rows],
+        'Weights': [format_weights(weights_record[i], tickers) for i in rows]
+    }, index=pd.RangeIndex(start + 1, stop + 1, name='Rank'))
+    return page_df
+
+# Step 7b: Walk-forward backtest with incrementally updated mean and covariance
+class RollingMoments:
+    """
+    Running mean and covariance of a window of daily returns.
+    Days are added or removed as blocks of rows, so sliding the window costs O(k * N^2) for k days
+    instead of O(T * N^2) for recomputing mean() and cov() over the whole window.
+    """
+
+    def __init__(self, num_assets):
+        self.count = 0
+        self.sum = np.zeros(num_assets)
+        self.cross = np.zeros((num_assets, num_assets))
+
+    def add(self, rows):
+        rows = np.atleast_2d(rows)
+        self.count += len(rows)
+        self.sum += rows.sum(axis=0)
+        self.cross += rows.T @ rows
+
+    def remove(self, rows):
+        rows = np.atleast_2d(rows)
+        self.count -= len(rows)
+        self.sum -= rows.sum(axis=0)
+        self.cross -= rows.T @ rows
+
+    def mean(self):
+        return self.sum / self.count
+
+    def cov(self):
+        mean = self.mean()
+        return (self.cross - self.count * np.outer(mean, mean)) / (self.count - 1)
+
+def walk_forward_backtest(returns, window=252, rebalance_every=21, expanding=False, objective='max_sharpe', risk_free_rate=0.01):
+    """
+    Out-of-sample walk-forward backtest. At every rebalance date the optimizer is re-run on the
+    trailing window (or all history when expanding=True) and the weights are held until the next
+    rebalance. Returns the stitched out-of-sample daily returns and the weights used at each rebalance.
+    """
+    asset_returns = returns.to_numpy(dtype=float)
+    num_days, num_assets = asset_returns.shape
+    if num_days <= window:
+        raise ValueError(f"Need more than {window} days of returns for the walk-forward window, got {num_days}")
+
+    moments = RollingMoments(num_assets)
+    moments.add(asset_returns[:window])
+    budget = {'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones(num_assets)}
+    weights = np.full(num_assets, 1.0 / num_assets)
+
+    out_of_sample = np.empty(num_days - window)
+    weights_history = []
+    for start in range(window, num_days, rebalance_every):
+        stop = min(start + rebalance_every, num_days)
+        mean_returns, cov_matrix = moments.mean(), moments.cov()
+        if objective == 'min_variance':
+            weights = _min_variance_weights(cov_matrix, [budget], weights)
+        else:
+            weights = _tangency_weights(mean_returns, cov_matrix, risk_free_rate, weights)
+        weights = np.clip(weights, 0, None) / np.clip(weights, 0, None).sum()
+        weights_history.append(weights)
+
+        out_of_sample[start - window:stop - window] = asset_returns[start:stop] @ weights
+
+        # Slide the window forward to the next rebalance date
+        moments.add(asset_returns[start:stop])
+        if not expanding:
+            moments.remove(asset_returns[start - window:stop - window])
+
+    rebalance_dates = returns.index[window::rebalance_every]
+    portfolio_returns = pd.Series(out_of_sample, index=returns.index[window:], name='Walk-Forward Portfolio')
+    weights_df = pd.DataFrame(weights_history, index=rebalance_dates, columns=returns.columns)
+    return portfolio_returns, weights_df
+
+# Step 8: Calculate the R alpha using CAPM forumula, beta using slope of regression through volitilty.
+def calculate_alpha_beta(portfolio_returns, market_returns, risk_free_rate):
+    """
+    Calculate alpha and beta for a portfolio using the CAPM model.
+    Alpha is the excess return relative to the market, adjusted for risk-free rate.
+    Beta measures the systematic risk of the portfolio.
+    """
+    # Ensure both series are tz-naive
+    portfolio_returns.index = portfolio_returns.index.tz_localize(None)
+    market_returns.index = market_returns.index.tz_localize(None)
+
+    # Ensure both series have the same length and drop NaN values
+    combined_df = pd.concat([portfolio_returns, market_returns], axis=1).dropna()
+    portfolio_returns = combined_df.iloc[:, 0]
+    market_returns = combined_df.iloc[:, 1]
+
+    # Perform linear regression to calculate beta (slope) and alpha (intercept)
+    X = market_returns.values.reshape(-1, 1)  # Independent variable (market returns)
+    y = portfolio_returns.values              # Dependent variable (portfolio returns)
+    X = np.hstack([np.ones_like(X), X])       # Add column for intercept
+    coef = np.linalg.lstsq(X, y, rcond=None)[0]  # Solve for regression coefficients
+    intercept, beta = coef[0], coef[1]        # Intercept and slope from regression
+
+    # Calculate average returns
+    R = portfolio_returns.sum()         # Portfolio return
+    Rm = market_returns.sum()          # Market return
+
+    # Calculate alpha using the CAPM formula
+    alpha = (R - risk_free_rate) - beta * (Rm - risk_free_rate)
+
+    return alpha, beta
+
+# Step 8b: Realized backtest and CAPM metrics for every frontier portfolio in one pass
+def frontier_realized_metrics(returns, market_returns, weights_record, risk_free_rate, chunk_size=4096):
+    """
+    Realized cumulative return, maximum drawdown, alpha and beta for every portfolio in weights_record.
+    Portfolio return series come from one returns x weights matrix product per chunk of portfolios,
+    and betas from closed-form asset betas (cov(asset, market) / var(market)), which equal the
+    regression slope calculate_alpha_beta fits for each portfolio separately.
+    A 2-D (float32, float64 or memory-mapped) weights_record is read chunk by chunk without a full copy.
+    """
+    combined = pd.concat([returns, market_returns.rename('__market__')], axis=1).dropna()
+    asset_returns = combined[returns.columns].to_numpy(dtype=float)
+    market = combined['__market__'].to_numpy(dtype=float)
+    weights_record = weights_record if isinstance(weights_record, np.ndarray) else np.asarray(weights_record, dtype=float)
+    num_portfolios = len(weights_record)
+
+    # Betas and CAPM alphas only need per-asset statistics, so they cost one matrix-vector product
+    market_centered = market - market.mean()
+    asset_betas = (asset_returns - asset_returns.mean(axis=0)).T @ market_centered / (market_centered @ market_centered)
+    asset_totals = asset_returns.sum(axis=0)
+
+    cumulative_returns = np.empty(num_portfolios)
+    max_drawdowns = np.empty(num_portfolios)
+    betas = np.empty(num_portfolios)
+    alphas = np.empty(num_portfolios)
+    for start in range(0, num_portfolios, chunk_size):
+        stop = min(start + chunk_size, num_portfolios)
+        weights = np.asarray(weights_record[start:stop], dtype=float)
+        betas[start:stop] = weights @ asset_betas
+        alphas[start:stop] = (weights @ asset_totals - risk_free_rate) - betas[start:stop] * (market.sum() - risk_free_rate)
+        wealth = np.cumprod(1 + asset_returns @ weights.T, axis=0)
+        cumulative_returns[start:stop] = wealth[-1] - 1
+        max_drawdowns[start:stop] = (wealth / np.maximum.accumulate(wealth, axis=0) - 1).min(axis=0)
+
+    return pd.DataFrame({
+        'Realized Cumulative Return': cumulative_returns,
+        'Max Drawdown': max_drawdowns,
+        'Alpha': alphas,
+        'Beta': betas
+    })
+
+# Step 11: Forward Monte Carlo projection of portfolio value with VaR / CVaR
+def simulate_portfolio_paths(weights, returns, horizon=252, num_paths=10000, method='normal', seed=None,
+                             chunk_size=10000, fan_paths=5000, percentiles=(5, 25, 50, 75, 95), confidence=0.95):
+    """
+    Simulate the value of 1 invested in a fixed-weight portfolio over `horizon` trading days.
+    method='normal' draws correlated normal asset returns from the historical mean/cov. With fixed
+    weights w'r is exactly N(w'mean, w'Cov w), so it is drawn directly at one draw per path-day.
+    method='bootstrap' resamples whole historical days, keeping the cross-asset dependence and fat tails.
+    Paths are generated in chunks, each with its own Generator spawned from one SeedSequence, so a
+    seed reproduces the same paths. The percentile fan is built from the first fan_paths paths, while
+    VaR/CVaR and terminal statistics use every path.
+    """
+    weights = np.asarray(weights, dtype=float)
+    portfolio_returns = returns.to_numpy(dtype=float) @ weights
+    daily_mean = portfolio_returns.mean()
+    daily_std = np.sqrt(weights @ returns.cov().to_numpy() @ weights)
+
+    num_chunks = -(-num_paths // chunk_size)
+    generators = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(num_chunks)]
+    terminal_values = np.empty(num_paths)
+    fan_values = []
+
+    for chunk, rng in enumerate(generators):
+        start = chunk * chunk_size
+        stop = min(start + chunk_size, num_paths)
+        if method == 'bootstrap':
+            daily_returns = portfolio_returns[rng.integers(0, len(portfolio_returns), size=(stop - start, horizon))]
+        else:
+            daily_returns = rng.normal(daily_mean, daily_std, size=(stop - start, horizon))
+        values = np.cumprod(1 + daily_returns, axis=1)
+        terminal_values[start:stop] = values[:, -1]
+        if start < fan_paths:
+            fan_values.append(values[:fan_paths - start])
+
+    fan_values = np.vstack(fan_values)
+    fan = pd.DataFrame(
+        np.percentile(fan_values, percentiles, axis=0).T,
+        index=pd.RangeIndex(1, horizon + 1, name='Day'),
+        columns=[f"P{p}" for p in percentiles]
+    )
+    fan.loc[0] = 1.0
+    fan = fan.sort_index()
+
+    losses = 1 - terminal_values
+    value_at_risk = np.quantile(losses, confidence)
+    summary = {
+        'Expected Value': terminal_values.mean(),
+        'Median Value': np.median(terminal_values),
+        'Probability of Loss': (terminal_values < 1).mean(),
+        f'VaR ({confidence:.0%})': value_at_risk,
+        f'CVaR ({confidence:.0%})': losses[losses >= value_at_risk].mean()
+    }
+    return fan, summary, terminal_values
@@ -0,0 +1,318 @@
+import os
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+# Local on-disk price cache used by get_data and the market index downloads.
+# Each symbol is stored as one .npz file holding its closing prices and the date
+# ranges that have already been fetched, so repeat analyses only download the gaps.
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "PORTFOLIO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "portfolio-analysis")
+)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# An empty response for a gap this short is a weekend or holiday, so it is cached as covered;
+# longer empty gaps are only covered when the source confirms it has no prices for them
+SHORT_GAP_DAYS = 5
+
+
+def yfinance_download(symbols, start, end):
+    """
+    Download adjusted closing prices for symbols over [start, end) as a DataFrame with one column per symbol.
+    Symbols are requested one by one through yf.Ticker, which (unlike yf.download) keeps no module-level
+    state, so ChunkedDownloader can run several calls on different threads. Network, time zone and
+    rate-limit errors raise so they can be retried; symbols Yahoo reports as having no prices in the
+    range are listed in the result's attrs['no_data'].
+    """
+    import yfinance as yf
+    from yfinance.exceptions import YFPricesMissingError
+
+    closes = {}
+    no_data = []
+    for symbol in symbols:
+        try:
+            history = yf.Ticker(symbol).history(start=start, end=end, auto_adjust=True, raise_errors=True)
+        except YFPricesMissingError:
+            no_data.append(symbol)
+            continue
+        # Drop the exchange time zone before aligning so dates don't shift across markets
+        close = history['Close']
+        close.index = pd.DatetimeIndex(close.index).tz_localize(None)
+        closes[symbol] = close
+    prices = pd.DataFrame(closes)
+    prices.attrs['no_data'] = no_data
+    return prices
+
+
+class ChunkedDownloader:
+    """
+    Wrap a downloader so large symbol lists are split into chunks fetched concurrently on a bounded
+    thread pool. A failing chunk is retried with exponential backoff and jitter, then split in half
+    (without further waits) so a single bad symbol cannot sink the rest of its chunk.
+    It never raises: the pieces are aligned on one date index, and symbols whose requests still raised
+    are listed with the error in the result's attrs['failures']. Symbols that were fetched but have no
+    prices in the range are absent and are not failures; those the source confirmed have none
+    (e.g. dates before listing) are passed on in attrs['no_data'].
+    """
+
+    def __init__(self, downloader=yfinance_download, chunk_size=20, max_workers=8, retries=3, backoff=0.5, sleep=time.sleep):
+        self.downloader = downloader
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.sleep = sleep
+
+    def _fetch(self, symbols, start, end, retries):
+        # Returns (frames, failures) for one chunk
+        for attempt in range(retries + 1):
+            try:
+                return [self.downloader(symbols, start, end)], {}
+            except Exception as e:
+                error = e
+                if attempt < retries:
+                    self.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        if len(symbols) == 1:
+            return [], {symbols[0]: f"{type(error).__name__}: {error}"}
+        middle = len(symbols) // 2
+        first_frames, first_failures = self._fetch(symbols[:middle], start, end, 0)
+        second_frames, second_failures = self._fetch(symbols[middle:], start, end, 0)
+        return first_frames + second_frames, {**first_failures, **second_failures}
+
+    def __call__(self, symbols, start, end):
+        symbols = list(symbols)
+        chunks = [symbols[i:i + self.chunk_size] for i in range(0, len(symbols), self.chunk_size)]
+        if len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                outcomes = list(pool.map(lambda chunk: self._fetch(chunk, start, end, self.retries), chunks))
+        else:
+            outcomes = [self._fetch(chunk, start, end, self.retries) for chunk in chunks]
+
+        frames, failures, no_data = [], {}, []
+        for chunk_frames, chunk_failures in outcomes:
+            frames.extend(frame for frame in chunk_frames if not frame.empty)
+            no_data.extend(symbol for frame in chunk_frames for symbol in frame.attrs.get('no_data', []))
+            failures.update(chunk_failures)
+        if frames:
+            prices = pd.concat([frame.set_axis(pd.DatetimeIndex(frame.index).tz_localize(None).normalize()) for frame in frames], axis=1)
+        else:
+            prices = pd.DataFrame(index=pd.DatetimeIndex([], name='Date'))
+        prices.attrs['failures'] = failures
+        prices.attrs['no_data'] = no_data
+        return prices
+
+
+class FakeDownloader:
+    """
+    Offline stand-in for yfinance_download that generates deterministic business-day prices.
+    A price depends only on the symbol and the date, so overlapping fetches always agree.
+    Every call is recorded in `calls` so tests can check which ranges were fetched.
+
+    Failures can be injected: a request containing one of `fail_symbols` always raises ConnectionError,
+    one containing a key of `flaky_symbols` raises until that symbol has failed the given number of times,
+    `missing_symbols` are silently left out like a transient empty response, and `delisted_symbols` are
+    left out and listed in attrs['no_data'] like prices Yahoo reports missing. `latency` (seconds) is slept
+    on every call and `max_concurrent` records how many calls overlapped, to exercise concurrent fetches.
+    """
+
+    def __init__(self, fail_symbols=(), flaky_symbols=None, missing_symbols=(), latency=0.0, delisted_symbols=()):
+        self.fail_symbols = set(fail_symbols)
+        self.flaky_symbols = dict(flaky_symbols or {})
+        self.missing_symbols = set(missing_symbols)
+        self.delisted_symbols = set(delisted_symbols)
+        self.latency = latency
+        self.calls = []
+        self.max_concurrent = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __call__(self, symbols, start, end):
+        with self._lock:
+            self.calls.append((tuple(symbols), pd.Timestamp(start), pd.Timestamp(end)))
+            self._active += 1
+            self.max_concurrent = max(self.max_concurrent, self._active)
+            failing = [symbol for symbol in symbols if symbol in self.fail_symbols or self.flaky_symbols.get(symbol, 0) > 0]
+            for symbol in failing:
+                if symbol in self.flaky_symbols:
+                    self.flaky_symbols[symbol] -= 1
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if failing:
+                raise ConnectionError(f"Injected failure for {', '.join(failing)}")
+        finally:
+            with self._lock:
+                self._active -= 1
+
+        no_data = [symbol for symbol in symbols if symbol in self.delisted_symbols]
+        symbols = [symbol for symbol in symbols if symbol not in self.missing_symbols | self.delisted_symbols]
+        dates = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), name='Date')
+        days = (dates - pd.Timestamp('2000-01-01')).days.to_numpy()
+        prices = {}
+        for symbol in symbols:
+            seed = zlib.crc32(symbol.encode()) % 1000
+            noise = np.modf(np.abs(np.sin(days * 12.9898 + seed) * 43758.5453))[0] - 0.5
+            drift = (seed % 7 + 1) * 1e-4
+            prices[symbol] = 100 * np.exp(drift * days + 0.1 * np.sin(days / 20 + seed) + 0.02 * noise)
+        prices = pd.DataFrame(prices, index=dates)
+        prices.attrs['no_data'] = no_data
+        return prices
+
+
+def _to_day(date):
+    return int(pd.Timestamp(date).tz_localize(None).normalize().to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing_ranges(covered, start, end):
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end <= cursor:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class PriceCache:
+    """
+    Closing-price cache keyed by symbol and date that only fetches missing date ranges.
+    When the cache directory grows past max_bytes the least recently used symbols are evicted.
+    In offline mode nothing is downloaded and only prices already on disk are served.
+    The default downloader fetches Yahoo Finance prices in concurrent chunks (see ChunkedDownloader).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, downloader=None, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir
+        self.downloader = downloader or ChunkedDownloader()
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def memo_key(self):
+        return (self.cache_dir, self.offline)
+
+    def _path(self, symbol):
+        return os.path.join(self.cache_dir, quote(symbol, safe='') + '.npz')
+
+    def _load(self, symbol):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return {'dates': np.empty(0, dtype=np.int64), 'close': np.empty(0), 'covered': []}
+        with np.load(path) as stored:
+            entry = {'dates': stored['dates'], 'close': stored['close'], 'covered': stored['covered'].tolist()}
+        os.utime(path)  # Mark as recently used for eviction
+        return entry
+
+    def _save(self, symbol, entry):
+        path = self._path(symbol)
+        temp_path = f"{path}.{os.getpid()}.tmp"  # Per-process temp file so batch workers never collide
+        with open(temp_path, 'wb') as f:
+            np.savez(f, dates=entry['dates'], close=entry['close'], covered=np.asarray(entry['covered'], dtype=np.int64).reshape(-1, 2))
+        os.replace(temp_path, path)
+
+    def _evict(self):
+        files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.npz')]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in files)
+        for path in files:
+            if total <= self.max_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def get_closes(self, symbols, start, end):
+        """
+        Return closing prices for symbols over [start, end) as a DataFrame indexed by date.
+        Symbols with no available prices are left out of the result and listed with the reason
+        in its attrs['failures'].
+        """
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        start_day, end_day = _to_day(start), _to_day(end)
+        # Never mark today or later as fetched since those prices can still change
+        coverable_end = min(end_day, _to_day(pd.Timestamp.today()))
+
+        entries = {symbol: self._load(symbol) for symbol in symbols}
+
+        # Group symbols by identical missing range so each gap is a single download
+        missing = {}
+        for symbol, entry in entries.items():
+            for gap in _missing_ranges(entry['covered'], start_day, end_day):
+                missing.setdefault(gap, []).append(symbol)
+
+        failures = {}
+        if missing and not self.offline:
+            for (gap_start, gap_end), gap_symbols in missing.items():
+                fetched = self.downloader(
+                    gap_symbols,
+                    pd.Timestamp(int(gap_start), unit='D'),
+                    pd.Timestamp(int(gap_end), unit='D')
+                )
+                gap_failures = fetched.attrs.get('failures', {})
+                gap_no_data = set(fetched.attrs.get('no_data', []))
+                failures.update(gap_failures)
+                fetched.index = pd.DatetimeIndex(fetched.index).tz_localize(None).normalize()
+                for symbol in gap_symbols:
+                    if symbol in gap_failures:
+                        continue  # Requests that raised are not marked covered, so they are retried next time
+                    has_prices = symbol in fetched.columns and fetched[symbol].notna().any()
+                    if not has_prices and gap_end - gap_start > SHORT_GAP_DAYS and symbol not in gap_no_data:
+                        continue  # An unexplained empty response may be transient, so it is retried next time
+                    # Otherwise an empty gap is a weekend, holiday or confirmed to have no prices, and is covered
+                    entry = entries[symbol]
+                    if has_prices:
+                        prices = fetched[symbol].dropna()
+                        dates = np.concatenate([prices.index.to_numpy().astype('datetime64[D]').astype(np.int64), entry['dates']])
+                        close = np.concatenate([prices.to_numpy(dtype=float), entry['close']])
+                        dates, first = np.unique(dates, return_index=True)  # Freshly fetched prices win
+                        entry['dates'], entry['close'] = dates, close[first]
+                    if gap_start < coverable_end:
+                        entry['covered'] = _merge_ranges(entry['covered'] + [[gap_start, min(gap_end, coverable_end)]])
+                    self._save(symbol, entry)
+            self._evict()
+
+        columns = {}
+        for symbol, entry in entries.items():
+            in_range = (entry['dates'] >= start_day) & (entry['dates'] < end_day)
+            if in_range.any():
+                columns[symbol] = pd.Series(
+                    entry['close'][in_range],
+                    index=pd.DatetimeIndex(entry['dates'][in_range].astype('datetime64[D]').astype('datetime64[ns]'), name='Date')
+                )
+        closes = pd.DataFrame(columns)
+        # Only symbols left without any prices are reported; a failed gap next to cached prices is retried later
+        closes.attrs['failures'] = {
+            symbol: failures.get(symbol, "not in the offline cache" if self.offline else "no price data")
+            for symbol in symbols if symbol not in columns
+        }
+        return closes
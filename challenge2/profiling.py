@@ -0,0 +1,206 @@
+import contextlib
+import functools
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+# Per-stage instrumentation for a Deploy run or a batch job. A Profiler records wall time,
+# peak traced memory (optional, via tracemalloc) and the rows/bytes fetched inside each named
+# stage, plus a log of every price request so duplicate fetches of the same symbol and date
+# range can be counted. Results export as JSON or Prometheus text for the headless path.
+#
+#   with Profiler(track_memory=True) as profiler:
+#       provider = profiler.instrument(provider)
+#       with profiler.stage("Step 1: Fetch data"):
+#           returns = get_data(tickers, start, end, provider)
+#   print(profiler.to_prometheus())
+
+
+class Profiler:
+    """
+    Collects timing, memory and fetch statistics for named pipeline stages.
+    Stages may nest; entering a stage with the same name again adds to its totals.
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.stages = {}
+        self.fetches = []
+        self._active = []
+        self._started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = self.stages.setdefault(name, {'stage': name, 'calls': 0, 'seconds': 0.0, 'peak_bytes': 0, 'rows': 0, 'bytes': 0})
+        frame = {'name': name}
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._active:
+                # Fold the parent's peak so far into its frame before the child resets it
+                self._active[-1]['peak'] = max(self._active[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['base'] = frame['peak'] = current
+        self._active.append(frame)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] += time.perf_counter() - started
+            record['calls'] += 1
+            self._active.pop()
+            if self.track_memory:
+                frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_bytes'] = max(record['peak_bytes'], frame['peak'] - frame['base'])
+                if self._active:
+                    self._active[-1]['peak'] = max(self._active[-1]['peak'], frame['peak'])
+                tracemalloc.reset_peak()
+
+    def close(self):
+        """
+        Stop tracemalloc if this profiler started it.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Also runs when the run is interrupted (e.g. a Streamlit rerun), so tracing never outlives it
+        self.close()
+
+    def record_fetch(self, source, symbols, start, end, frame, seconds=0.0):
+        """
+        Log one price request and charge its rows and bytes to every active stage.
+        """
+        rows = len(frame)
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        self.fetches.append({
+            'source': source,
+            'stage': self._active[-1]['name'] if self._active else None,
+            'symbols': [symbols] if isinstance(symbols, str) else list(symbols),
+            'start': str(pd.Timestamp(start).date()),
+            'end': str(pd.Timestamp(end).date()),
+            'rows': rows,
+            'bytes': size,
+            'seconds': seconds
+        })
+        for active in {active_frame['name'] for active_frame in self._active}:
+            self.stages[active]['rows'] += rows
+            self.stages[active]['bytes'] += size
+
+    def wrap_fetch(self, fetch, source):
+        """
+        Wrap a fetch(symbols, start, end) -> DataFrame callable (e.g. a PriceCache downloader) so its calls are logged.
+        """
+        @functools.wraps(fetch)
+        def wrapper(symbols, start, end):
+            started = time.perf_counter()
+            frame = fetch(symbols, start, end)
+            self.record_fetch(source, symbols, start, end, frame, time.perf_counter() - started)
+            return frame
+
+        return wrapper
+
+    def instrument(self, provider, source='provider'):
+        return InstrumentedProvider(provider, self, source)
+
+    def fetch_summary(self):
+        """
+        Per-source request counts, rows, bytes and time, with the number of symbol/date-range
+        requests that repeat an earlier request from the same source (redundant fetches).
+        """
+        summary = {}
+        seen = set()
+        for fetch in self.fetches:
+            entry = summary.setdefault(fetch['source'], {'requests': 0, 'symbols': 0, 'redundant': 0, 'rows': 0, 'bytes': 0, 'seconds': 0.0})
+            entry['requests'] += 1
+            entry['rows'] += fetch['rows']
+            entry['bytes'] += fetch['bytes']
+            entry['seconds'] += fetch['seconds']
+            for symbol in fetch['symbols']:
+                key = (fetch['source'], symbol, fetch['start'], fetch['end'])
+                entry['symbols'] += 1
+                entry['redundant'] += key in seen
+                seen.add(key)
+        return summary
+
+    def stage_table(self):
+        return pd.DataFrame(list(self.stages.values()), columns=['stage', 'calls', 'seconds', 'peak_bytes', 'rows', 'bytes'])
+
+    def to_dict(self):
+        return {'stages': list(self.stages.values()), 'fetches': self.fetches, 'fetch_summary': self.fetch_summary()}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def merge(self, data):
+        """
+        Add the stages and fetches of another profiler's to_dict() output (e.g. from a worker process).
+        """
+        for stage in data['stages']:
+            record = self.stages.setdefault(stage['stage'], {'stage': stage['stage'], 'calls': 0, 'seconds': 0.0, 'peak_bytes': 0, 'rows': 0, 'bytes': 0})
+            for field in ('calls', 'seconds', 'rows', 'bytes'):
+                record[field] += stage[field]
+            record['peak_bytes'] = max(record['peak_bytes'], stage['peak_bytes'])
+        self.fetches.extend(data['fetches'])
+
+    def to_prometheus(self, prefix='portfolio'):
+        """
+        Render the stage and fetch statistics in the Prometheus text exposition format.
+        """
+        stage_metrics = [
+            ('stage_seconds_total', 'counter', 'seconds', 'Wall time spent in the stage.'),
+            ('stage_calls_total', 'counter', 'calls', 'Times the stage was entered.'),
+            ('stage_peak_memory_bytes', 'gauge', 'peak_bytes', 'Peak traced memory above the stage start (0 when not tracked).'),
+            ('stage_fetched_rows_total', 'counter', 'rows', 'Price rows fetched during the stage.'),
+            ('stage_fetched_bytes_total', 'counter', 'bytes', 'Price data bytes fetched during the stage.'),
+        ]
+        fetch_metrics = [
+            ('fetch_requests_total', 'counter', 'requests', 'Price requests issued.'),
+            ('fetch_symbols_total', 'counter', 'symbols', 'Symbols requested.'),
+            ('fetch_redundant_total', 'counter', 'redundant', 'Symbol/date-range requests repeating an earlier request.'),
+            ('fetch_rows_total', 'counter', 'rows', 'Price rows returned.'),
+            ('fetch_bytes_total', 'counter', 'bytes', 'Price data bytes returned.'),
+            ('fetch_seconds_total', 'counter', 'seconds', 'Wall time spent fetching.'),
+        ]
+        lines = []
+        for metrics, label, rows in ((stage_metrics, 'stage', self.stages.values()),
+                                     (fetch_metrics, 'source', [dict(entry, source=source) for source, entry in self.fetch_summary().items()])):
+            for suffix, kind, field, description in metrics:
+                lines.append(f"# HELP {prefix}_{suffix} {description}")
+                lines.append(f"# TYPE {prefix}_{suffix} {kind}")
+                for row in rows:
+                    lines.append(f'{prefix}_{suffix}{{{label}="{_escape_label(row[label])}"}} {row[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class InstrumentedProvider:
+    """
+    Provider wrapper that logs every get_closes call on a Profiler.
+    It reports the wrapped provider's memo_key, so memoized results depend only on the data source.
+    """
+
+    def __init__(self, provider, profiler, source='provider'):
+        self.provider = provider
+        self.profiler = profiler
+        self.source = source
+
+    def memo_key(self):
+        return self.provider.memo_key() if hasattr(self.provider, 'memo_key') else repr(self.provider)
+
+    def get_closes(self, symbols, start, end):
+        started = time.perf_counter()
+        closes = self.provider.get_closes(symbols, start, end)
+        self.profiler.record_fetch(self.source, symbols, start, end, closes, time.perf_counter() - started)
+        return closes
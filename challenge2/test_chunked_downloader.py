@@ -0,0 +1,103 @@
+import pytest
+
+import portfolio_core as core
+from price_cache import ChunkedDownloader, FakeDownloader, PriceCache
+
+
+def _chunked(fake, **kwargs):
+    # No real waiting between retries in tests
+    return ChunkedDownloader(fake, sleep=lambda seconds: None, **kwargs)
+
+
+def test_flaky_symbols_are_retried():
+    fake = FakeDownloader(flaky_symbols={'BBB': 2})
+    downloader = _chunked(fake, retries=3)
+
+    prices = downloader(['AAA', 'BBB'], '2021-01-01', '2021-02-01')
+
+    assert list(prices.columns) == ['AAA', 'BBB']
+    assert prices.attrs['failures'] == {}
+    assert len(fake.calls) == 3
+
+
+def test_failing_symbol_is_isolated_from_its_chunk():
+    fake = FakeDownloader(fail_symbols={'S3'})
+    downloader = _chunked(fake, chunk_size=8, retries=1)
+
+    prices = downloader([f"S{i}" for i in range(8)], '2021-01-01', '2021-02-01')
+
+    assert sorted(prices.columns) == sorted(f"S{i}" for i in range(8) if i != 3)
+    assert list(prices.attrs['failures']) == ['S3']
+    assert prices.attrs['failures']['S3'].startswith('ConnectionError')
+
+
+def test_chunks_are_fetched_concurrently():
+    fake = FakeDownloader(latency=0.05, delisted_symbols={'S5'})
+
+    prices = _chunked(fake, chunk_size=2, max_workers=4)([f"S{i}" for i in range(8)], '2021-01-01', '2021-02-01')
+
+    assert prices.shape[1] == 7
+    assert prices.attrs['no_data'] == ['S5']
+    assert fake.max_concurrent > 1
+
+
+def test_failed_symbols_are_retried_on_the_next_call(tmp_path):
+    fake = FakeDownloader(fail_symbols={'BBB'})
+    cache = PriceCache(str(tmp_path), downloader=_chunked(fake, retries=0))
+
+    closes = cache.get_closes(['AAA', 'BBB'], '2021-01-01', '2021-02-01')
+    assert list(closes.columns) == ['AAA']
+    assert closes.attrs['failures']['BBB'].startswith('ConnectionError')
+
+    fake.fail_symbols.clear()
+    closes = cache.get_closes(['AAA', 'BBB'], '2021-01-01', '2021-02-01')
+    assert list(closes.columns) == ['AAA', 'BBB']
+    assert fake.calls[-1][0] == ('BBB',)
+
+
+def test_gap_without_trading_days_is_not_refetched(tmp_path):
+    fake = FakeDownloader()
+    cache = PriceCache(str(tmp_path), downloader=_chunked(fake))
+
+    cache.get_closes(['AAA', 'BBB'], '2020-01-01', '2020-01-11')
+    for _ in range(3):
+        cache.get_closes(['AAA', 'BBB'], '2020-01-01', '2020-01-13')  # Extends over a weekend only
+
+    assert len(fake.calls) == 2
+
+
+def test_unexplained_empty_response_is_refetched(tmp_path):
+    fake = FakeDownloader(missing_symbols={'AAA'})
+    cache = PriceCache(str(tmp_path), downloader=_chunked(fake))
+
+    assert cache.get_closes(['AAA'], '2021-01-01', '2021-03-01').attrs['failures'] == {'AAA': 'no price data'}
+    fake.missing_symbols.clear()
+    closes = cache.get_closes(['AAA'], '2021-01-01', '2021-03-01')
+
+    assert len(fake.calls) == 2
+    assert list(closes.columns) == ['AAA'] and closes.attrs['failures'] == {}
+
+
+def test_confirmed_missing_prices_are_not_refetched(tmp_path):
+    fake = FakeDownloader(delisted_symbols={'AAA'})
+    cache = PriceCache(str(tmp_path), downloader=_chunked(fake))
+
+    for _ in range(3):
+        closes = cache.get_closes(['AAA'], '2021-01-01', '2021-03-01')
+
+    assert len(fake.calls) == 1
+    assert closes.attrs['failures'] == {'AAA': 'no price data'}
+
+
+def test_partial_context_drops_failed_tickers(tmp_path):
+    fake = FakeDownloader(missing_symbols={'CCC'})
+    cache = PriceCache(str(tmp_path), downloader=_chunked(fake))
+    args = (['AAA', 'BBB', 'CCC'], [0.2, 0.3, 0.5], '2021-01-01', '2022-01-01', 'S&P 500', 0.01, cache)
+
+    with pytest.raises(ValueError, match='CCC'):
+        core.build_analysis_context(*args)
+    context = core.build_analysis_context(*args, allow_partial=True)
+
+    assert context.tickers == ['AAA', 'BBB']
+    assert context.weights == pytest.approx([0.4, 0.6])
+    assert context.failures == {'CCC': 'no price data'}
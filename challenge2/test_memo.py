@@ -0,0 +1,49 @@
+import pickle
+import sys
+import types
+
+import numpy as np
+
+from memo import MemoStore, memoize
+
+
+def test_memory_tier_is_bounded_by_size():
+    store = MemoStore(max_bytes=3 * 8000)
+    for key in 'abcd':
+        store.put(key, np.zeros(1000))  # 8000 bytes each
+
+    assert store.nbytes == 3 * 8000
+    assert store.get('a') == (False, None)
+    assert all(store.get(key)[0] for key in 'bcd')
+
+
+def test_value_larger_than_the_memory_tier_is_served_from_disk(tmp_path):
+    store = MemoStore(disk_dir=str(tmp_path), max_bytes=1000)
+    store.put('small', np.zeros(10))
+    store.put('large', np.zeros(1000))
+
+    assert store.nbytes == 80
+    hit, value = store.get('large')
+    assert hit and value.shape == (1000,)
+    assert store.get('small')[0]
+
+
+def test_stale_pickle_is_a_miss(tmp_path):
+    module = types.ModuleType('removed_memo_module')
+    exec("class Result:\n    pass", module.__dict__)
+    sys.modules['removed_memo_module'] = module
+    try:
+        stale = pickle.dumps(module.Result())
+    finally:
+        del sys.modules['removed_memo_module']
+
+    calls = []
+    store = MemoStore(disk_dir=str(tmp_path))
+    cached = memoize(store)(lambda x: calls.append(x) or x * 2)
+    cached(1)
+    store.clear()
+    (path,) = tmp_path.iterdir()
+    path.write_bytes(stale)
+
+    assert cached(1) == 2
+    assert calls == [1, 1]
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import portfolio_core as core
+from benchmark import synthetic_returns
+
+pytest.importorskip("scipy")
+
+
+def _direct_max_sharpe(mean_returns, cov_matrix, risk_free_rate, starts=10, lower=0.0, upper=1.0):
+    # Best of several direct max-Sharpe solves over w from random feasible starts
+    num_assets = len(mean_returns)
+    excess_returns = mean_returns - risk_free_rate / 252
+    lower, upper = np.full(num_assets, lower), np.full(num_assets, upper)
+    rng = np.random.default_rng(0)
+    best = -np.inf
+    for _ in range(starts):
+        start = core._project_capped_simplex(rng.dirichlet(np.ones(num_assets))[None, :], lower, upper, 1.0)[0]
+        weights = core._max_sharpe_weights(excess_returns, cov_matrix, start, list(zip(lower, upper)))
+        best = max(best, core.portfolio_performance(weights, mean_returns, cov_matrix, risk_free_rate)[2])
+    return best
+
+
+@pytest.mark.parametrize("seed", [0, 3, 7])
+def test_tangency_matches_direct_max_sharpe(seed):
+    returns, _ = synthetic_returns(10, seed=seed)
+    mean_returns, cov_matrix = returns.mean().to_numpy(), returns.cov().to_numpy()
+
+    weights = core._tangency_weights(mean_returns, cov_matrix, 0.01, np.full(10, 0.1))
+    sharpe = core.portfolio_performance(weights, mean_returns, cov_matrix, 0.01)[2]
+
+    assert weights.min() >= 0 and weights.sum() == pytest.approx(1)
+    assert sharpe >= _direct_max_sharpe(mean_returns, cov_matrix, 0.01) - 1e-6
+
+
+def test_exact_frontier_max_sharpe_is_tangency():
+    returns, _ = synthetic_returns(10, seed=1)
+    mean_returns, cov_matrix = returns.mean().to_numpy(), returns.cov().to_numpy()
+
+    results, weights_record = core.exact_frontier(mean_returns, cov_matrix, risk_free_rate=0.01)
+
+    assert results[2].max() == pytest.approx(_direct_max_sharpe(mean_returns, cov_matrix, 0.01), abs=1e-6)
+    np.random.seed(0)
+    sampled, _ = core.efficient_frontier(mean_returns, cov_matrix, 20000, 0.01)
+    assert results[2].max() >= sampled[2].max()
+    assert results[0].min() <= sampled[0].min()
+
+
+def test_exact_frontier_honours_weight_bounds():
+    returns, _ = synthetic_returns(10, seed=2)
+    mean_returns, cov_matrix = returns.mean().to_numpy(), returns.cov().to_numpy()
+
+    results, weights_record = core.exact_frontier(mean_returns, cov_matrix, risk_free_rate=0.01, min_weights=0.02, max_weights=0.2)
+
+    assert weights_record.min() >= 0.02 - 1e-9 and weights_record.max() <= 0.2 + 1e-9
+    assert np.allclose(weights_record.sum(axis=1), 1)
+    assert results[2].max() == pytest.approx(_direct_max_sharpe(mean_returns, cov_matrix, 0.01, lower=0.02, upper=0.2), abs=1e-6)
+    unbounded, _ = core.exact_frontier(mean_returns, cov_matrix, risk_free_rate=0.01)
+    assert results[2].max() <= unbounded[2].max() + 1e-9
+    with pytest.raises(ValueError, match="100%"):
+        core.exact_frontier(mean_returns, cov_matrix, max_weights=0.05)
+
+
+@pytest.mark.parametrize("num_assets, num_days, min_weight, max_weight", [(20, 756, 0.0, 1.0), (40, 30, 0.0, 1.0), (30, 500, 0.01, 0.1)])
+def test_exact_frontier_min_variance_matches_slsqp(num_assets, num_days, min_weight, max_weight):
+    returns, _ = synthetic_returns(num_assets, num_days=num_days, seed=4)
+    mean_returns, cov_matrix = returns.mean().to_numpy(), returns.cov().to_numpy()  # Rank deficient when num_days < num_assets
+    lower, upper = np.full(num_assets, min_weight), np.full(num_assets, max_weight)
+
+    results, weights_record = core.exact_frontier(mean_returns, cov_matrix, risk_free_rate=0.01, min_weights=min_weight, max_weights=max_weight)
+    start = core._project_capped_simplex(np.full((1, num_assets), 1 / num_assets), lower, upper, 1.0)[0]
+    min_var_weights = core._min_variance_weights(cov_matrix, [{'type': 'eq', 'fun': lambda w: w.sum() - 1}], start, list(zip(lower, upper)))
+
+    assert results[0].min() <= core.portfolio_performance(min_var_weights, mean_returns, cov_matrix, 0.01)[1] + 1e-9
+    assert np.all(np.diff(results[1]) >= 0)
+    assert weights_record.min() >= min_weight - 1e-9 and weights_record.max() <= max_weight + 1e-9
+
+
+def test_exact_frontier_with_factor_covariance_matches_dense():
+    returns, _ = synthetic_returns(60, num_days=252, seed=5)
+    mean_returns = returns.mean().to_numpy()
+    factor_cov = core.factor_model_covariance(returns, num_factors=4)
+
+    results, weights_record = core.exact_frontier(mean_returns, factor_cov, risk_free_rate=0.01, max_weights=0.1)
+    dense_results, dense_weights = core.exact_frontier(mean_returns, factor_cov.to_dense().to_numpy(), risk_free_rate=0.01, max_weights=0.1)
+
+    np.testing.assert_allclose(results, dense_results, rtol=1e-8, atol=1e-12)
+    np.testing.assert_allclose(weights_record, dense_weights, atol=1e-9)
+
+
+def test_walk_forward_max_sharpe_rebalances_to_the_in_sample_optimum():
+    # Asset A has by far the best risk-adjusted return, so the optimum is far from equal weight
+    rng = np.random.default_rng(0)
+    means = np.array([2e-3, 5e-4, 4e-4, 3e-4, 2e-4, 1e-4])
+    vols = np.array([0.005, 0.01, 0.015, 0.02, 0.02, 0.025])
+    returns = pd.DataFrame(rng.normal(means, vols, (500, 6)), index=pd.bdate_range('2020-01-01', periods=500), columns=list('ABCDEF'))
+
+    _, weights = core.walk_forward_backtest(returns, window=252, rebalance_every=63, risk_free_rate=0.01)
+
+    assert np.all(np.abs(weights.to_numpy() - 1 / 6).max(axis=1) > 0.2)
+    assert np.all(weights['A'] == weights.max(axis=1))
+    window = returns.iloc[:252]
+    in_sample_sharpe = core.portfolio_performance(weights.iloc[0].to_numpy(), window.mean().to_numpy(), window.cov().to_numpy(), 0.01)[2]
+    assert in_sample_sharpe >= _direct_max_sharpe(window.mean().to_numpy(), window.cov().to_numpy(), 0.01) - 1e-6
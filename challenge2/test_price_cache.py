@@ -0,0 +1,75 @@
+import os
+
+import pandas as pd
+
+from price_cache import FakeDownloader, PriceCache, _merge_ranges, _missing_ranges
+
+
+def test_missing_ranges_are_the_uncovered_parts():
+    covered = _merge_ranges([[10, 20], [15, 30], [40, 50]])
+
+    assert covered == [[10, 30], [40, 50]]
+    assert _missing_ranges(covered, 0, 60) == [(0, 10), (30, 40), (50, 60)]
+    assert _missing_ranges(covered, 12, 28) == []
+
+
+def test_repeat_request_is_served_from_disk(tmp_path):
+    fake = FakeDownloader()
+    cache = PriceCache(str(tmp_path), downloader=fake)
+
+    first = cache.get_closes(['AAA', 'BBB'], '2021-01-01', '2021-06-01')
+    second = PriceCache(str(tmp_path), downloader=fake).get_closes(['AAA', 'BBB'], '2021-01-01', '2021-06-01')
+
+    assert len(fake.calls) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_only_missing_date_ranges_are_fetched(tmp_path):
+    fake = FakeDownloader()
+    cache = PriceCache(str(tmp_path), downloader=fake)
+
+    cache.get_closes(['AAA'], '2021-03-01', '2021-06-01')
+    extended = cache.get_closes(['AAA'], '2021-01-01', '2021-09-01')
+
+    assert [(start, end) for _, start, end in fake.calls[1:]] == [
+        (pd.Timestamp('2021-01-01'), pd.Timestamp('2021-03-01')),
+        (pd.Timestamp('2021-06-01'), pd.Timestamp('2021-09-01')),
+    ]
+    pd.testing.assert_frame_equal(extended, fake(['AAA'], '2021-01-01', '2021-09-01'), check_freq=False, check_index_type=False)
+
+
+def test_symbols_with_the_same_gap_share_one_download(tmp_path):
+    fake = FakeDownloader()
+    cache = PriceCache(str(tmp_path), downloader=fake)
+
+    cache.get_closes(['AAA'], '2021-01-01', '2021-03-01')
+    cache.get_closes(['AAA', 'BBB', 'CCC'], '2021-01-01', '2021-03-01')
+
+    assert [symbols for symbols, _, _ in fake.calls] == [('AAA',), ('BBB', 'CCC')]
+
+
+def test_offline_mode_serves_only_cached_prices(tmp_path):
+    fake = FakeDownloader()
+    PriceCache(str(tmp_path), downloader=fake).get_closes(['AAA'], '2021-01-01', '2021-03-01')
+    offline = PriceCache(str(tmp_path), downloader=fake, offline=True)
+
+    closes = offline.get_closes(['AAA', 'ZZZ'], '2021-01-01', '2021-06-01')
+
+    assert len(fake.calls) == 1
+    assert list(closes.columns) == ['AAA']
+    assert closes.index.max() < pd.Timestamp('2021-03-01')
+    assert closes.attrs['failures'] == {'ZZZ': 'not in the offline cache'}
+
+
+def test_least_recently_used_symbols_are_evicted(tmp_path):
+    fake = FakeDownloader()
+    probe = PriceCache(str(tmp_path / 'probe'), downloader=fake)
+    probe.get_closes(['AAA'], '2015-01-01', '2021-01-01')
+    entry_size = os.path.getsize(probe._path('AAA'))
+
+    cache = PriceCache(str(tmp_path / 'cache'), downloader=fake, max_bytes=int(entry_size * 2.5))
+    for symbol in ('AAA', 'BBB', 'CCC'):
+        cache.get_closes([symbol], '2015-01-01', '2021-01-01')
+        os.utime(cache._path(symbol), (0, len(os.listdir(cache.cache_dir))))  # Strictly increasing mtimes
+
+    assert sorted(os.listdir(cache.cache_dir)) == ['BBB.npz', 'CCC.npz']
@@ -0,0 +1,31 @@
+import tracemalloc
+
+import pytest
+
+from profiling import Profiler
+
+
+class _Interrupted(BaseException):
+    # Stands in for Streamlit's rerun/stop exceptions, which are not Exceptions
+    pass
+
+
+def test_interrupted_run_stops_tracing():
+    with pytest.raises(_Interrupted):
+        with Profiler(track_memory=True) as profiler:
+            with profiler.stage("Step 1: Fetch data"):
+                raise _Interrupted()
+
+    assert not tracemalloc.is_tracing()
+    assert profiler.stages["Step 1: Fetch data"]['calls'] == 1
+
+
+def test_tracing_started_elsewhere_is_left_running():
+    tracemalloc.start()
+    try:
+        with Profiler(track_memory=True) as profiler:
+            with profiler.stage("Step 1: Fetch data"):
+                pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
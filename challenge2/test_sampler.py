@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import portfolio_core as core
+
+
+def _check_weights(weights, sampler):
+    held = weights > 0
+    assert np.allclose(weights.sum(axis=1), 1)
+    assert np.all(held.sum(axis=1) <= sampler.max_holdings)
+    assert np.all(weights <= sampler.upper + 1e-9)
+    assert np.all(weights[held] >= np.broadcast_to(sampler.lower, weights.shape)[held] - 1e-9)
+
+
+def test_minimum_weight_applies_to_every_asset_without_a_holdings_limit():
+    sampler = core.ConstrainedSampler(6, 0.05, 0.4, seed=0)
+    weights = sampler.sample(500)
+
+    _check_weights(weights, sampler)
+    assert np.all(weights >= 0.05 - 1e-9)
+
+
+def test_minimum_weight_is_semi_continuous_with_a_holdings_limit():
+    sampler = core.ConstrainedSampler(10, 0.05, 1.0, max_holdings=5, seed=0)
+    weights = sampler.sample(500)
+
+    _check_weights(weights, sampler)
+    assert np.all((weights > 0).sum(axis=1) == 5)
+    assert np.all((weights > 0).any(axis=0))  # Every asset is held in some portfolio
+
+
+def test_minimum_weights_of_the_held_assets_must_fit():
+    core.ConstrainedSampler(10, 0.25, 1.0, max_holdings=4)
+    with pytest.raises(ValueError, match="held assets"):
+        core.ConstrainedSampler(10, 0.3, 1.0, max_holdings=4)
+
+
+def test_semi_continuous_minimum_respects_sector_caps():
+    sectors = ['Tech'] * 6 + ['Energy'] * 2
+    sampler = core.ConstrainedSampler(8, 0.1, 0.5, sectors, {'Tech': 0.3}, max_holdings=4, seed=1)
+    weights = sampler.sample(500)
+
+    _check_weights(weights, sampler)
+    assert np.all(weights[:, :6].sum(axis=1) <= 0.3 + 1e-9)
+    assert sampler.stats['selection_redraws'] > 0  # Selections holding four Tech assets are redrawn
+    with pytest.raises(ValueError, match="sector Tech"):
+        core.ConstrainedSampler(8, 0.1, 0.5, sectors, {'Tech': 0.15}, max_holdings=4)  # Two Tech assets are always held
+
+
+def test_sharded_frontier_reports_the_same_sampler_stats_in_and_out_of_process():
+    mean_returns = np.linspace(1e-4, 1e-3, 8)
+    cov_matrix = np.diag(np.linspace(1e-4, 4e-4, 8))
+    stats = []
+    for workers in (1, 2):
+        sampler = core.ConstrainedSampler(8, 0.05, 0.4, ['A'] * 4 + ['B'] * 4, {'A': 0.5}, max_holdings=4, seed=0)
+        core.sharded_efficient_frontier(mean_returns, cov_matrix, 5000, workers=workers, seed=0, chunk_size=500, shards=4, sampler=sampler)
+        assert sampler.stats['seconds'] > 0
+        stats.append((sampler.stats['portfolios'], sampler.stats['selection_redraws']))
+
+    assert stats[0] == stats[1]
+    assert stats[0][0] == 5000 and stats[0][1] > 0